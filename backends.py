@@ -0,0 +1,180 @@
+import numpy as np
+import numpy.typing as npt
+import warnings
+import compiler
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS: tuple[str, ...] = ('numpy', 'numba')
+
+# logic types as integers for the kernels
+LOGIC_CODES: dict[str, int] = {'and': 0, 'or': 1, '': 2}
+
+
+def numba_available() -> bool:
+    return numba is not None
+
+
+def njit(f):
+    # nopython-compile the kernels when numba is installed, compiled code is cached on disk (__pycache__) between runs
+    return numba.njit(cache=True)(f) if numba is not None else f
+
+
+@njit
+def gene_rate(y, g, reg_index, reg_Kd, reg_n, reg_active, reg_activator, logic, alpha):
+    down = 1.0
+    up_and = 1.0
+    up_or = 1.0
+    up_single = 1.0
+    has_activator = False
+    for r in range(reg_index.shape[1]):
+        if not reg_active[g, r]:
+            continue
+        x = (y[reg_index[g, r]] / reg_Kd[g, r]) ** reg_n[g, r]
+        down *= 1.0 + x
+        if reg_activator[g, r]:
+            if not has_activator:
+                up_single = x
+            has_activator = True
+            up_and *= x
+            up_or *= 1.0 + x
+    if not has_activator:
+        up = 1.0
+    elif logic[g] == 1:
+        up = up_or - 1.0
+    elif logic[g] == 2:
+        up = up_single
+    else:
+        up = up_and
+    return alpha[g] * up / down
+
+
+@njit
+def rhs_kernel(y, reg_index, reg_Kd, reg_n, reg_active, reg_activator, logic, alpha, delta, product_ptr, product_species):
+    dy = -delta * y
+    for g in range(reg_index.shape[0]):
+        rate = gene_rate(y, g, reg_index, reg_Kd, reg_n, reg_active, reg_activator, logic, alpha)
+        for p in range(product_ptr[g], product_ptr[g+1]):
+            dy[product_species[p]] += rate
+    return dy
+
+
+@njit
+def jac_kernel(y, reg_index, reg_Kd, reg_n, reg_active, reg_activator, logic, alpha, delta, product_ptr, product_species):
+    n_species = y.shape[0]
+    n_regulators = reg_index.shape[1]
+    J = np.zeros((n_species, n_species))
+    x = np.zeros(n_regulators)
+    dx = np.zeros(n_regulators)
+    for g in range(reg_index.shape[0]):
+        first = -1
+        for r in range(n_regulators):
+            if reg_active[g, r]:
+                y_r = y[reg_index[g, r]]
+                x[r] = (y_r / reg_Kd[g, r]) ** reg_n[g, r]
+                dx[r] = reg_n[g, r] / reg_Kd[g, r] * (y_r / reg_Kd[g, r]) ** (reg_n[g, r] - 1.0)
+                if reg_activator[g, r] and first < 0:
+                    first = r
+        # rate = alpha*U/D with D = prod(1 + x_r), d rate/d x_r = alpha*(dU_r*D - U*dD_r)/D**2
+        D = 1.0
+        U_and = 1.0
+        U_or = 1.0
+        for r in range(n_regulators):
+            if reg_active[g, r]:
+                D *= 1.0 + x[r]
+                if reg_activator[g, r]:
+                    U_and *= x[r]
+                    U_or *= 1.0 + x[r]
+        if first < 0:
+            U = 1.0
+        elif logic[g] == 1:
+            U = U_or - 1.0
+        elif logic[g] == 2:
+            U = x[first]
+        else:
+            U = U_and
+        for r in range(n_regulators):
+            if not reg_active[g, r]:
+                continue
+            dD = 1.0
+            dU_and = 1.0
+            dU_or = 1.0
+            for s in range(n_regulators):
+                if s == r or not reg_active[g, s]:
+                    continue
+                dD *= 1.0 + x[s]
+                if reg_activator[g, s]:
+                    dU_and *= x[s]
+                    dU_or *= 1.0 + x[s]
+            if not reg_activator[g, r]:
+                dU = 0.0
+            elif logic[g] == 1:
+                dU = dU_or
+            elif logic[g] == 2:
+                dU = 1.0 if r == first else 0.0
+            else:
+                dU = dU_and
+            drate = alpha[g] * (dU * D - U * dD) / (D * D) * dx[r]
+            for p in range(product_ptr[g], product_ptr[g+1]):
+                J[product_species[p], reg_index[g, r]] += drate
+    for i in range(n_species):
+        J[i, i] -= delta[i]
+    return J
+
+
+class NumbaModel:
+    """CompiledModel evaluated by nopython kernels that loop over genes and regulators (no array temporaries)
+
+    The kernels are generic, so they are compiled once for all networks and parameter values.
+    """
+
+    def __init__(self, model: compiler.CompiledModel):
+        if model.parameter_batch_size != 1 or model.alpha.ndim != 1:
+            raise Exception("The numba backend doesn't support parameter batches")
+        self.model: compiler.CompiledModel = model
+        self.jac_sparsity = model.jac_sparsity
+        production = model.production.tocsc()
+        self.arguments: tuple = (
+            np.ascontiguousarray(model.reg_index, dtype=np.int64),
+            np.ascontiguousarray(model.reg_Kd, dtype=float),
+            np.ascontiguousarray(model.reg_n, dtype=float),
+            np.ascontiguousarray(model.reg_active),
+            np.ascontiguousarray(model.reg_activator),
+            np.array([LOGIC_CODES[logic_type] for logic_type in model.logic_type], dtype=np.int64),
+            np.ascontiguousarray(model.alpha, dtype=float),
+            np.ascontiguousarray(model.delta, dtype=float),
+            production.indptr.astype(np.int64),
+            production.indices.astype(np.int64),
+        )
+
+    def solve_model(self, T, state) -> npt.NDArray:
+        return rhs_kernel(np.asarray(state, dtype=float), *self.arguments)
+
+    def __call__(self, T, state) -> npt.NDArray:
+        return self.solve_model(T, state)
+
+    def solve_model_steady(self, state) -> npt.NDArray:
+        return self.solve_model(0, state)
+
+    def jac(self, T, state) -> npt.NDArray:
+        return jac_kernel(np.asarray(state, dtype=float), *self.arguments)
+
+
+def load_backend(grn, backend: str = 'numpy'):
+    """Model of grn for the given backend
+
+    'numpy': compiler.CompiledModel (vectorized, in memory)
+    'numba': NumbaModel, the same equations compiled with numba (nopython); falls back to 'numpy' if numba isn't
+             installed
+    """
+    if backend not in BACKENDS:
+        raise Exception(f"Invalid backend: expected one of {BACKENDS}, got {backend}")
+    model: compiler.CompiledModel = grn.compile_model()
+    if backend == 'numba':
+        if numba_available():
+            return NumbaModel(model)
+        warnings.warn("numba is not installed, falling back to the numpy backend")
+    return model
@@ -0,0 +1,325 @@
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse as sp
+import hashlib
+import itertools
+import copy
+from collections import OrderedDict
+
+LOGIC_TYPES: tuple[str, ...] = ('and', 'or', '')
+MODEL_CACHE_SIZE: int = 32
+
+# structural hash -> CompiledModel, least recently used first
+_model_cache: OrderedDict[str, 'CompiledModel'] = OrderedDict()
+
+
+def exclusive_prod(a: npt.NDArray, axis: int = 1) -> npt.NDArray:
+    """Product of all other elements along axis for every element (no division, safe for zeros)"""
+    a = np.moveaxis(a, axis, 0)
+    ones: npt.NDArray = np.ones_like(a[:1])
+    before: npt.NDArray = np.cumprod(np.concatenate([ones, a[:-1]]), axis=0)
+    after: npt.NDArray = np.cumprod(np.concatenate([ones, a[:0:-1]]), axis=0)[::-1]
+    return np.moveaxis(before * after, 0, axis)
+
+
+def with_batch_axis(a: npt.NDArray, base_ndim: int) -> npt.NDArray:
+    """Parameter arrays carry an optional trailing parameter-batch axis (see CompiledModel.with_parameters)"""
+    return a if a.ndim > base_ndim else a[..., None]
+
+
+class CompiledModel:
+    """In-memory, vectorized equivalent of the model written by grn.generate_model.
+
+    Regulators of all genes are stored in (genes x max_regulators) arrays; unused slots point to a
+    sentinel species with concentration 0, so they contribute a factor of 1 to every product.
+    Instances are callable with the solve_ivp signature (T, state).
+    """
+
+    def __init__(self, grn):
+        self.species_names: list[str] = list(grn.species_names)
+        self.input_species_names: list[str] = list(grn.input_species_names)
+        self.n_species: int = len(self.species_names)
+        self.n_genes: int = len(grn.gene_records)
+
+        def check_index(indices: tuple[int, ...], names: tuple[str, ...]):
+            for i, name in zip(indices, names):
+                if i < 0:
+                    raise Exception(f"{name} not in species!")
+
+        self.delta: npt.NDArray = np.array(grn.species_delta, dtype=float)
+
+        max_regulators: int = max([len(record.regulator_index) for record in grn.gene_records], default=0)
+        shape: tuple[int, int] = (self.n_genes, max_regulators)
+        # Padding slots index the sentinel species (index n_species) and use Kd = n = 1
+        self.reg_index: npt.NDArray = np.full(shape, self.n_species, dtype=np.intp)
+        self.reg_Kd: npt.NDArray = np.ones(shape)
+        self.reg_n: npt.NDArray = np.ones(shape)
+        self.reg_active: npt.NDArray = np.zeros(shape, dtype=bool)
+        self.reg_activator: npt.NDArray = np.zeros(shape, dtype=bool)
+        self.alpha: npt.NDArray = np.zeros(self.n_genes)
+        self.logic_type: list[str] = []
+
+        # the compact gene records of grn already hold species indices and parameter tuples, regulator slots are
+        # filled all at once
+        records: list = grn.gene_records
+        for record in records:
+            if record.logic_type not in LOGIC_TYPES:
+                raise Exception(f"Invalid logic type: {record.logic_type!r}")
+            check_index(record.regulator_index, record.regulator_names)
+            check_index(record.product_index, record.product_names)
+        self.logic_type = [record.logic_type for record in records]
+        self.alpha[:] = [record.alpha for record in records]
+        def slots(field: str) -> list:
+            return list(itertools.chain.from_iterable(getattr(record, field) for record in records))
+        n_regulators: npt.NDArray = np.array([len(record.regulator_index) for record in records], dtype=np.intp)
+        slot_gene: npt.NDArray = np.repeat(np.arange(self.n_genes), n_regulators)
+        slot_index: npt.NDArray = np.arange(len(slot_gene)) - np.repeat(np.cumsum(n_regulators) - n_regulators, n_regulators)
+        self.reg_index[slot_gene, slot_index] = slots('regulator_index')
+        self.reg_Kd[slot_gene, slot_index] = slots('regulator_Kd')
+        self.reg_n[slot_gene, slot_index] = slots('regulator_n')
+        self.reg_active[slot_gene, slot_index] = True
+        self.reg_activator[slot_gene, slot_index] = np.equal(slots('regulator_type'), 1)
+        product_species: list[int] = slots('product_index')
+        product_genes: npt.NDArray = np.repeat(np.arange(self.n_genes), [len(record.product_index) for record in records])
+
+        logic_type: npt.NDArray = np.array(self.logic_type, dtype=object)
+        self.is_or: npt.NDArray = logic_type == 'or'
+        self.is_single: npt.NDArray = logic_type == ''
+        self.has_activator: npt.NDArray = np.any(self.reg_activator, axis=1)
+        # Index of the first activator, used by the '' (single regulator) logic type
+        self.first_activator: npt.NDArray = np.argmax(self.reg_activator, axis=1) if max_regulators else np.zeros(self.n_genes, dtype=np.intp)
+
+        # (species x genes) matrix summing the rates of the genes that produce each species
+        self.production: sp.csr_matrix = sp.csr_matrix(
+            (np.ones(len(product_species)), (product_species, product_genes)),
+            shape=(self.n_species, self.n_genes),
+        )
+        # Structural non-zeros of the Jacobian, for jac_sparsity of BDF/Radau
+        self.jac_sparsity: sp.csr_matrix = grn.get_jacobian_sparsity()
+        # (gene, species) coordinates of the regulator slots in use, for the sparse Jacobian
+        self.reg_gene: npt.NDArray = np.broadcast_to(np.arange(self.n_genes)[:, None], shape)[self.reg_active]
+        self.reg_species: npt.NDArray = self.reg_index[self.reg_active]
+        # (species*species x genes*max_regulators) matrix adding the regulator slot derivatives of every gene to the
+        # Jacobian entries (product, regulator), for jac_batch
+        product_slots: npt.NDArray = self.reg_active[product_genes]
+        rows: npt.NDArray = (np.array(product_species, dtype=np.intp)[:, None] * self.n_species + self.reg_index[product_genes])[product_slots]
+        cols: npt.NDArray = (np.array(product_genes, dtype=np.intp)[:, None] * max_regulators + np.arange(max_regulators))[product_slots]
+        self.jac_scatter: sp.csr_matrix = sp.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(self.n_species ** 2, self.n_genes * max_regulators),
+        )
+
+    def with_parameters(self, Kd=None, n=None, alpha=None, delta=None) -> 'CompiledModel':
+        """Copy of the (unbatched) model with a batch of uniform parameter vectors as a trailing array axis
+
+        Each argument is an array of shape (batch,) (or None to keep the compiled values): Kd and n are applied to
+        every regulator, alpha to every gene and delta to every non-input species, the way the circuits in src/
+        use param_kd, param_n, param_alpha and param_delta. Member b of the batch is evaluated on state column b,
+        so integrate the result with EnsembleModel(model, batch_size).
+        """
+        batch: int = max([np.size(p) for p in (Kd, n, alpha, delta) if p is not None], default=1)
+        def broadcast(values, base: npt.NDArray, mask: npt.NDArray | None = None) -> npt.NDArray:
+            base = np.broadcast_to(with_batch_axis(base, base.ndim), (*base.shape, batch))
+            if values is None:
+                return base
+            values = np.broadcast_to(np.asarray(values, dtype=float), (batch,))
+            if mask is None:
+                return np.broadcast_to(values, base.shape).copy()
+            return np.where(mask[..., None], values, base)
+
+        model: CompiledModel = copy.copy(self)
+        is_input: npt.NDArray = np.isin(self.species_names, self.input_species_names)
+        model.reg_Kd = broadcast(Kd, self.reg_Kd, self.reg_active)
+        model.reg_n = broadcast(n, self.reg_n, self.reg_active)
+        model.alpha = broadcast(alpha, self.alpha)
+        model.delta = broadcast(delta, self.delta, ~is_input)
+        return model
+
+    def select_parameters(self, members) -> 'CompiledModel':
+        """Copy of a parameter-batched model (with_parameters) with only the batch members at the indices members"""
+        model: CompiledModel = copy.copy(self)
+        for name, base_ndim in (('reg_Kd', 2), ('reg_n', 2), ('alpha', 1), ('delta', 1)):
+            values: npt.NDArray = getattr(self, name)
+            if values.ndim > base_ndim:
+                setattr(model, name, values[..., members])
+        return model
+
+    @property
+    def parameter_batch_size(self) -> int:
+        return with_batch_axis(self.alpha, 1).shape[1]
+
+    def hill_terms(self, y: npt.NDArray) -> npt.NDArray:
+        """(Regulator/Kd)**n for every regulator slot, shape (genes, max_regulators, batch)"""
+        y_ext: npt.NDArray = np.concatenate([y, np.zeros((1, y.shape[1]))])
+        return (y_ext[self.reg_index] / with_batch_axis(self.reg_Kd, 2)) ** with_batch_axis(self.reg_n, 2)
+
+    def gene_rates(self, y: npt.NDArray) -> npt.NDArray:
+        """Expression rate of every gene for states of shape (species, batch)"""
+        x: npt.NDArray = self.hill_terms(y)
+        activator: npt.NDArray = self.reg_activator[..., None]
+        up: npt.NDArray = np.prod(np.where(activator, x, 1.0), axis=1)
+        if self.is_or.any():
+            # Sum over all non-empty subsets of activator terms == prod(1 + x) - 1
+            up_or: npt.NDArray = np.prod(np.where(activator, 1.0 + x, 1.0), axis=1) - 1.0
+            up = np.where(self.is_or[:, None], up_or, up)
+        if self.is_single.any():
+            up_single: npt.NDArray = x[np.arange(self.n_genes), self.first_activator]
+            up = np.where(self.is_single[:, None], up_single, up)
+        # Genes without activators are expressed at the full rate alpha (numerator '1')
+        up = np.where(self.has_activator[:, None], up, 1.0)
+        # 1 + sum over all non-empty subsets of regulator terms == prod(1 + x)
+        down: npt.NDArray = np.prod(1.0 + x, axis=1)
+        return with_batch_axis(self.alpha, 1) * up / down
+
+    def regulator_derivatives(self, y: npt.NDArray) -> npt.NDArray:
+        """d rate_g / d y for every regulator slot of every gene, shape (genes, max_regulators, batch)"""
+        y_ext: npt.NDArray = np.concatenate([y, np.zeros((1, y.shape[1]))])[self.reg_index]
+        Kd: npt.NDArray = with_batch_axis(self.reg_Kd, 2)
+        n: npt.NDArray = with_batch_axis(self.reg_n, 2)
+        x: npt.NDArray = (y_ext / Kd) ** n
+        dx: npt.NDArray = n / Kd * (y_ext / Kd) ** (n - 1)
+        one_plus_x: npt.NDArray = 1.0 + x
+        activator: npt.NDArray = self.reg_activator[..., None]
+
+        # and: U = prod(x_act), dU/dx_r = prod of the other activators
+        U: npt.NDArray = np.prod(np.where(activator, x, 1.0), axis=1)
+        dU: npt.NDArray = exclusive_prod(np.where(activator, x, 1.0))
+        if self.is_or.any():
+            # or: U = prod(1 + x_act) - 1, dU/dx_r = prod of (1 + x) of the other activators
+            U = np.where(self.is_or[:, None], np.prod(np.where(activator, one_plus_x, 1.0), axis=1) - 1.0, U)
+            dU = np.where(self.is_or[:, None, None], exclusive_prod(np.where(activator, one_plus_x, 1.0)), dU)
+        if self.is_single.any():
+            first: npt.NDArray = np.zeros_like(self.reg_activator)
+            first[np.arange(self.n_genes), self.first_activator] = True
+            U = np.where(self.is_single[:, None], x[np.arange(self.n_genes), self.first_activator], U)
+            dU = np.where(self.is_single[:, None, None], first[..., None].astype(float), dU)
+        dU = np.where(activator, dU, 0.0)
+        U = np.where(self.has_activator[:, None], U, 1.0)
+
+        D: npt.NDArray = np.prod(one_plus_x, axis=1)[:, None]
+        dD: npt.NDArray = exclusive_prod(one_plus_x)
+        drate: npt.NDArray = with_batch_axis(self.alpha, 1)[:, None] * (dU * D - U[:, None] * dD) / (D ** 2)
+        return np.where(self.reg_active[..., None], drate * dx, 0.0)
+
+    def jac(self, T, state) -> npt.NDArray:
+        """Analytic Jacobian of rhs for a single state, shape (species, species)"""
+        y: npt.NDArray = np.asarray(state, dtype=float)
+        # d rate_g / d y_j, the extra sentinel column collects the padding slots
+        C: npt.NDArray = np.zeros((self.n_genes, self.n_species + 1))
+        np.add.at(C, (np.arange(self.n_genes)[:, None], self.reg_index), self.regulator_derivatives(y[:, None])[..., 0])
+        J: npt.NDArray = self.production @ C[:, :self.n_species]
+        J[np.diag_indices(self.n_species)] -= self.delta
+        return J
+
+    def jac_sparse(self, T, state) -> sp.csc_matrix:
+        """Analytic Jacobian of rhs for a single state as a sparse matrix (for BDF/Radau)"""
+        y: npt.NDArray = np.asarray(state, dtype=float)
+        C: sp.csr_matrix = sp.csr_matrix(
+            (self.regulator_derivatives(y[:, None])[self.reg_active, 0], (self.reg_gene, self.reg_species)),
+            shape=(self.n_genes, self.n_species),
+        )
+        return sp.csc_matrix(self.production @ C - sp.diags(self.delta))
+
+    def jac_batch(self, y: npt.NDArray) -> npt.NDArray:
+        """Analytic Jacobians of rhs for states of shape (species, batch), shape (batch, species, species)"""
+        batch: int = y.shape[1]
+        drate: npt.NDArray = np.broadcast_to(self.regulator_derivatives(y), (*self.reg_index.shape, batch))
+        J: npt.NDArray = (self.jac_scatter @ drate.reshape(-1, batch)).T.reshape(batch, self.n_species, self.n_species)
+        delta: npt.NDArray = np.broadcast_to(with_batch_axis(self.delta, 1), (self.n_species, batch))
+        J[:, np.arange(self.n_species), np.arange(self.n_species)] -= delta.T
+        return J
+
+    def rhs(self, T, state) -> npt.NDArray:
+        state = np.asarray(state, dtype=float)
+        y: npt.NDArray = state.reshape(self.n_species, -1)
+        dy: npt.NDArray = self.production @ self.gene_rates(y) - with_batch_axis(self.delta, 1) * y
+        return dy.reshape(state.shape)
+
+    def __call__(self, T, state) -> npt.NDArray:
+        return self.rhs(T, state)
+
+    def solve_model(self, T, state) -> npt.NDArray:
+        return self.rhs(T, state)
+
+    def solve_model_steady(self, state) -> npt.NDArray:
+        return self.rhs(0, state)
+
+
+class EnsembleModel:
+    """batch_size independent copies of a CompiledModel integrated as one stacked system
+
+    The stacked state is species-major: state.reshape(n_species, batch_size)[:, b] is the state of copy b, which is
+    the layout CompiledModel.rhs already evaluates in one vectorized call. The Jacobian is block diagonal (up to the
+    species-major permutation) and is only provided in sparse form, so use a sparse solver (BDF/Radau).
+    """
+
+    def __init__(self, model: CompiledModel, batch_size: int):
+        self.model: CompiledModel = model
+        self.batch_size: int = batch_size
+        self.n_species: int = model.n_species * batch_size
+        identity: sp.csr_matrix = sp.csr_matrix(sp.identity(batch_size))
+        # species-major stacking: index i*batch_size + b
+        self.production: sp.csr_matrix = sp.csr_matrix(sp.kron(model.production, identity))
+        self.delta: npt.NDArray = np.broadcast_to(with_batch_axis(model.delta, 1), (model.n_species, batch_size)).ravel()
+        self.jac_sparsity: sp.csr_matrix = sp.csr_matrix(sp.kron(model.jac_sparsity, identity), dtype=bool)
+        self.reg_gene: npt.NDArray = (model.reg_gene[:, None] * batch_size + np.arange(batch_size)).ravel()
+        self.reg_species: npt.NDArray = (model.reg_species[:, None] * batch_size + np.arange(batch_size)).ravel()
+
+    def split(self, state: npt.NDArray) -> npt.NDArray:
+        """Stacked state(s) of shape (n_species*batch_size, ...) -> (batch_size, n_species, ...)"""
+        state = np.asarray(state)
+        return np.moveaxis(state.reshape(self.model.n_species, self.batch_size, *state.shape[1:]), 1, 0)
+
+    def stack(self, states: npt.NDArray) -> npt.NDArray:
+        """States of shape (batch_size, n_species) -> stacked state"""
+        return np.asarray(states, dtype=float).T.ravel()
+
+    def jac_sparse(self, T, state) -> sp.csc_matrix:
+        y: npt.NDArray = np.asarray(state, dtype=float).reshape(self.model.n_species, self.batch_size)
+        C: sp.csr_matrix = sp.csr_matrix(
+            (self.model.regulator_derivatives(y)[self.model.reg_active].ravel(), (self.reg_gene, self.reg_species)),
+            shape=(self.model.n_genes * self.batch_size, self.n_species),
+        )
+        return sp.csc_matrix(self.production @ C - sp.diags(self.delta))
+
+    def jac(self, T, state) -> npt.NDArray:
+        return self.jac_sparse(T, state).toarray()
+
+    def solve_model(self, T, state) -> npt.NDArray:
+        return self.model.rhs(T, state)
+
+    def __call__(self, T, state) -> npt.NDArray:
+        return self.model.rhs(T, state)
+
+
+def structural_hash(grn) -> str:
+    """Hash of everything the equations depend on: species, input species, genes and their parameters"""
+    species = [(str(name), float(delta)) for name, delta in zip(grn.species_names, grn.species_delta)]
+    genes = [
+        (
+            float(record.alpha),
+            str(record.logic_type),
+            [(str(name), int(type_), float(Kd), float(n)) for name, type_, Kd, n in zip(record.regulator_names, record.regulator_type, record.regulator_Kd, record.regulator_n)],
+            [str(name) for name in record.product_names],
+        )
+        for record in grn.gene_records
+    ]
+    key = repr((species, [str(name) for name in grn.input_species_names], genes))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def compile_model(grn, cache: bool = True) -> CompiledModel:
+    """Compile grn, reusing the compiled model of a structurally identical grn from the in-process LRU cache"""
+    if not cache:
+        return CompiledModel(grn)
+    key: str = structural_hash(grn)
+    if key in _model_cache:
+        _model_cache.move_to_end(key)
+        return _model_cache[key]
+    model: CompiledModel = CompiledModel(grn)
+    _model_cache[key] = model
+    while len(_model_cache) > MODEL_CACHE_SIZE:
+        _model_cache.popitem(last=False)
+    return model
+
+def clear_model_cache():
+    _model_cache.clear()
@@ -1,27 +1,100 @@
 
 import numpy as np
+import scipy.sparse as sp
 import simulator
-from helpers import powerset
+import compiler
+from helpers import powerset, factored_powerset_sum
 
 import networkx as nx
 import matplotlib.pyplot as plt
 
 
 
+class gene_record:
+    # compact gene record: regulators and products as parallel tuples, species by index into grn.species_names
+    # (-1 for names that aren't species yet); records are never modified, so copies of a grn share them
+    __slots__ = ('alpha', 'logic_type', 'regulator_names', 'regulator_index', 'regulator_type', 'regulator_Kd',
+                 'regulator_n', 'product_names', 'product_index')
+
+    def __init__(self, alpha, logic_type, regulator_names, regulator_index, regulator_type, regulator_Kd, regulator_n, product_names, product_index):
+        self.alpha = alpha
+        self.logic_type = logic_type
+        self.regulator_names = regulator_names
+        self.regulator_index = regulator_index
+        self.regulator_type = regulator_type
+        self.regulator_Kd = regulator_Kd
+        self.regulator_n = regulator_n
+        self.product_names = product_names
+        self.product_index = product_index
+
+    def to_dict(self):
+        regulators = [{'name': name, 'type': type_, 'Kd': Kd, 'n': n} for name, type_, Kd, n in
+                      zip(self.regulator_names, self.regulator_type, self.regulator_Kd, self.regulator_n)]
+        products = [{'name': name} for name in self.product_names]
+        return {'alpha': self.alpha, 'regulators': regulators, 'products': products, 'logic_type': self.logic_type}
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
 class grn:
     def __init__(self):
-        self.species = []        
         self.species_names = []
         self.input_species_names = []
-        self.genes = []
+        # species by name (index into species_names) and parameter lists, species and genes are built from them
+        self.species_index = {}
+        self.input_species_set = set()
+        self.species_delta = []
+        self.gene_records = []
+        # positions in gene_records of the genes with names that weren't species yet, add_species resolves them
+        self.unresolved_genes = []
+
+    @property
+    def species(self):
+        # [{'name': name, 'delta': delta}], a copy
+        return [{'name': name, 'delta': delta} for name, delta in zip(self.species_names, self.species_delta)]
+
+    @property
+    def genes(self):
+        # [{'alpha', 'regulators', 'products', 'logic_type'}] as passed to add_gene, a copy
+        return [record.to_dict() for record in self.gene_records]
 
     def add_input_species(self, name):        
         self.add_species(name, 0) # input species are species that do not degrade
         self.input_species_names.append(name)
+        self.input_species_set.add(name)
 
     def add_species(self, name, delta):
-        self.species.append({'name': name, 'delta': delta})
+        self.species_index[name] = len(self.species_names)
         self.species_names.append(name)
+        self.species_delta.append(delta)
+        if self.unresolved_genes:
+            self.resolve_genes()
+
+    def resolve_genes(self):
+        # re-resolve the names of the genes added before (some of) their species, records are replaced, not modified
+        def resolve(indices, names):
+            indices = tuple(i if i >= 0 else self.species_index.get(name, -1) for i, name in zip(indices, names))
+            return indices, tuple(self.species_names[i] if i >= 0 else name for i, name in zip(indices, names))
+
+        unresolved = []
+        for g in self.unresolved_genes:
+            record = self.gene_records[g]
+            regulator_index, regulator_names = resolve(record.regulator_index, record.regulator_names)
+            product_index, product_names = resolve(record.product_index, record.product_names)
+            self.gene_records[g] = gene_record(record.alpha, record.logic_type, regulator_names, regulator_index,
+                                               record.regulator_type, record.regulator_Kd, record.regulator_n,
+                                               product_names, product_index)
+            if min(regulator_index + product_index, default=0) < 0:
+                unresolved.append(g)
+        self.unresolved_genes = unresolved
+
+    def is_input_species(self, name):
+        return name in self.input_species_set
 
     """
         regulator = {'name': str - name,
@@ -36,24 +109,55 @@ class grn:
         if logic_type == 'mixed':
             logic_type = np.random.choice(['and', 'or'])
 
-        gene = {'alpha': alpha,
-                'regulators': regulators,
-                'products': products,
-                'logic_type': logic_type}
-        
-        for regulator in regulators:
-            if regulator['name'] not in self.species_names:
+        regulator_index = [self.species_index.get(regulator['name'], -1) for regulator in regulators]
+        product_index = [self.species_index.get(product['name'], -1) for product in products]
+
+        for regulator, i in zip(regulators, regulator_index):
+            if i < 0:
                 print(f'{regulator["name"]} not in species!')
 
-        for product in products:
-            if product['name'] not in self.species_names:
+        for product, i in zip(products, product_index):
+            if i < 0:
                 print(f'{product["name"]} not in species!')
 
-
-        self.genes.append(gene)
-
-
-    def generate_equations(self):
+        if min(regulator_index + product_index, default=0) < 0:
+            self.unresolved_genes.append(len(self.gene_records))
+
+        # known names are stored as the species_names strings, so equal names share one object (also when pickled)
+        self.gene_records.append(gene_record(
+            alpha,
+            logic_type,
+            tuple(self.species_names[i] if i >= 0 else regulator['name'] for regulator, i in zip(regulators, regulator_index)),
+            tuple(regulator_index),
+            tuple(regulator['type'] for regulator in regulators),
+            tuple(regulator['Kd'] for regulator in regulators),
+            tuple(regulator['n'] for regulator in regulators),
+            tuple(self.species_names[i] if i >= 0 else product['name'] for product, i in zip(products, product_index)),
+            tuple(product_index),
+        ))
+
+    def replace_parameters(self, delta, alpha, Kd, n):
+        # copy with the parameters at the given slots replaced: delta {species index: value}, alpha {gene index: value},
+        # Kd and n {(gene index, regulator position): value}; the structure is shared with this grn
+        copy = grn()
+        copy.species_names = list(self.species_names)
+        copy.input_species_names = list(self.input_species_names)
+        copy.species_index = dict(self.species_index)
+        copy.input_species_set = set(self.input_species_set)
+        copy.unresolved_genes = list(self.unresolved_genes)
+        copy.species_delta = [delta.get(i, value) for i, value in enumerate(self.species_delta)]
+        copy.gene_records = [
+            gene_record(alpha.get(g, record.alpha), record.logic_type, record.regulator_names, record.regulator_index,
+                        record.regulator_type, tuple(Kd.get((g, r), value) for r, value in enumerate(record.regulator_Kd)),
+                        tuple(n.get((g, r), value) for r, value in enumerate(record.regulator_n)),
+                        record.product_names, record.product_index)
+            for g, record in enumerate(self.gene_records)
+        ]
+        return copy
+
+
+    def generate_equations(self, factored=False):
+        # factored: emit denominators (and 'or' numerators) as k factors prod(1 + x_i) instead of 2^k powerset terms
         equations = {}
         
         for species in self.species:
@@ -82,17 +186,21 @@ class grn:
             if not up:
                 up = ['1']
 
-            if logic_type == 'or':
+            if logic_type == 'or' and factored and up != ['1']:
+                up = factored_powerset_sum(up, include_empty=False)
+            elif logic_type == 'or':
                 up = "+".join(powerset(up, op="*"))
             elif logic_type == 'and':
                 up = '*'.join(up)
             elif logic_type == '':
                 up = up[0]
             else:
-                print("Invalid logic type!")
-                return
+                raise Exception(f"Invalid logic type: {logic_type!r}")
 
-            down = "+".join(['1'] + powerset(down, op="*"))
+            if factored:
+                down = factored_powerset_sum(down) if down else '1'
+            else:
+                down = "+".join(['1'] + powerset(down, op="*"))
 
             terms = f'{gene["alpha"]}*({up})/({down})'
 
@@ -101,27 +209,131 @@ class grn:
 
         return equations
 
-    def generate_model(self, fname='model.py'):
-        equations = self.generate_equations()
+    def generate_jacobian_equations(self):
+        # analytic derivatives of generate_equations: {(species index, regulator index): [terms]}
+        # rate = alpha*U/D with D = prod(1 + x_r), so d rate/d x_r = alpha*(dU_r*D - U*dD_r)/D**2
+        index = self.species_index
+        equations = {}
+
+        def product(factors):
+            return '*'.join(factors) if factors else '1'
+
+        for i, species in enumerate(self.species):
+            equations[(i, i)] = [f'-{species["delta"]}']
 
-        with open(fname, 'w') as f: 
-            print(f'import numpy as np \n', file = f)
-            print(f'def solve_model(T,state):', file = f)
+        for gene in self.genes:
+            regulators = gene['regulators']
+            logic_type = gene['logic_type']
+            terms = [f'(({r["name"]}/{r["Kd"]})**{r["n"]})' for r in regulators]
+            activators = [k for k, r in enumerate(regulators) if r['type'] == 1]
+
+            D = product([f'(1+{t})' for t in terms])
+
+            if not activators:
+                U = '1'
+            elif logic_type == 'or':
+                U = factored_powerset_sum([terms[k] for k in activators], include_empty=False)
+            elif logic_type == 'and':
+                U = product([terms[k] for k in activators])
+            elif logic_type == '':
+                U = terms[activators[0]]
+            else:
+                raise Exception(f"Invalid logic type: {logic_type!r}")
+
+            for k, regulator in enumerate(regulators):
+                if k not in activators:
+                    dU = '0'
+                elif logic_type == 'or':
+                    dU = product([f'(1+{terms[l]})' for l in activators if l != k])
+                elif logic_type == 'and':
+                    dU = product([terms[l] for l in activators if l != k])
+                else:
+                    dU = '1' if k == activators[0] else '0'
+                dD = product([f'(1+{terms[l]})' for l in range(len(terms)) if l != k])
+
+                name, Kd, n = regulator['name'], regulator['Kd'], regulator['n']
+                dx = f'({n}/{Kd})*(({name}/{Kd})**({n}-1))'
+                term = f'{gene["alpha"]}*(({dU})*({D})-({U})*({dD}))/(({D})**2)*{dx}'
+
+                for p in gene['products']:
+                    equations.setdefault((index[p['name']], index[name]), []).append(term)
+
+        return equations
+
+    def get_jacobian_sparsity(self):
+        # J[i, j] can only be non-zero if species j regulates a gene producing species i (or i == j, degradation)
+        rows = list(range(len(self.species_names)))
+        cols = list(range(len(self.species_names)))
+
+        for record in self.gene_records:
+            for i in record.product_index:
+                for j in record.regulator_index:
+                    rows.append(i)
+                    cols.append(j)
+
+        shape = (len(self.species_names), len(self.species_names))
+        return sp.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=shape).tocsr().astype(bool)
+
+    def get_regulation_graph(self):
+        # directed graph of species indices, an edge from every regulator to every product of its genes
+        G = nx.DiGraph()
+        G.add_nodes_from(range(len(self.species_names)))
+        for record in self.gene_records:
+            G.add_edges_from((j, i) for j in record.regulator_index for i in record.product_index)
+        return G
+
+    def get_strongly_connected_components(self):
+        # strongly connected components of the regulation graph as sorted lists of species indices, in topological
+        # order: the species of a component are only regulated by species of the same or of earlier components
+        C = nx.condensation(self.get_regulation_graph())
+        return [sorted(C.nodes[c]['members']) for c in nx.topological_sort(C)]
+
+    def get_topological_order(self):
+        # species indices ordered by get_strongly_connected_components, the Jacobian is block lower triangular in it
+        return [i for component in self.get_strongly_connected_components() for i in component]
+
+    def get_stages(self):
+        # components grouped by their depth in the condensed regulation graph, as sorted lists of species indices:
+        # the components of a stage are independent of each other and only regulated by earlier stages (and themselves)
+        C = nx.condensation(self.get_regulation_graph())
+        return [sorted(i for c in generation for i in C.nodes[c]['members']) for generation in nx.topological_generations(C)]
+
+    def generate_model(self, fname='model.py', factored=False):
+        with simulator.phase('generate_model'):
+            equations = self.generate_equations(factored=factored)
+
+            with open(fname, 'w') as f: 
+                print(f'import numpy as np \n', file = f)
+                print(f'def solve_model(T,state):', file = f)
             
-            all_keys = ', '.join([f'{key}' for key in equations.keys()])
-            all_dkeys = ', '.join([f'd{key}' for key in equations.keys()])
+                all_keys = ', '.join([f'{key}' for key in equations.keys()])
+                all_dkeys = ', '.join([f'd{key}' for key in equations.keys()])
             
-            print(f'    {all_keys} = state', file=f)
+                print(f'    {all_keys} = state', file=f)
 
-            for key in equations.keys():
-                print(f'    d{key} = {"+".join(equations[key])}', file=f)
+                for key in equations.keys():
+                    print(f'    d{key} = {"+".join(equations[key])}', file=f)
                 
-            print(f'    return np.array([{all_dkeys}])', file=f)
+                print(f'    return np.array([{all_dkeys}])', file=f)
             
-            #print('',file=f)
-            print('',file=f)
-            print(f'def solve_model_steady(state):', file = f)
-            print(f'    return solve_model(0, state)', file = f)
+                #print('',file=f)
+                print('',file=f)
+                print(f'def solve_model_steady(state):', file = f)
+                print(f'    return solve_model(0, state)', file = f)
+
+                jacobian = self.generate_jacobian_equations()
+                print('',file=f)
+                print(f'def jac(T,state):', file = f)
+                print(f'    {all_keys} = state', file=f)
+                print(f'    J = np.zeros(({len(equations)}, {len(equations)}))', file=f)
+                for (i, j), terms in jacobian.items():
+                    print(f'    J[{i}, {j}] += {"+".join(terms)}', file=f)
+                print(f'    return J', file=f)
+
+    def compile_model(self, cache=True):
+        # vectorized in-memory alternative to generate_model, no source code is generated
+        # structurally identical networks share one compiled model (LRU cache keyed by compiler.structural_hash)
+        return compiler.compile_model(self, cache=cache)
 
 
     def plot_network(self):
@@ -25,3 +25,12 @@ def powerset(s, op):
     T = itertools.chain.from_iterable(itertools.combinations(s, r) for r in range(len(s)+1))
     return [op.join(t) for t in T if t]
 #    # sestavi vse možne podmnožice seta s, z velikostmi do len(s+1) in jih združi v en sam iterable (from_iterable)
+
+
+def factored_powerset_sum(s, include_empty=True):
+    # 1 + sum over all non-empty subsets of s (products of their elements) == prod(1 + x) for x in s
+    # k factors instead of 2^k terms, without the leading 1 when include_empty is False
+    product = '*'.join([f'(1+{x})' for x in s])
+    if include_empty:
+        return product
+    return f'({product}-1)'
@@ -0,0 +1,193 @@
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse as sp
+import scipy.sparse.linalg
+import compiler
+
+# Methods integrated by integrate_samples below instead of the solve_ivp solvers
+METHODS: tuple[str, ...] = ('Rosenbrock',)
+
+# Shampine's modified Rosenbrock pair of order 2(3), L-stable (MATLAB's ode23s)
+GAMMA: float = 1 / (2 + np.sqrt(2))
+E32: float = 6 + np.sqrt(2)
+
+MIN_FACTOR: float = 0.2
+MAX_FACTOR: float = 5
+SAFETY: float = 0.9
+
+# Larger models factorize the sparse stacked Jacobian instead of inverting dense per-member blocks
+DENSE_MAX_SPECIES: int = 32
+
+
+def batch_functions(model):
+    """functions(members) -> (rhs, jac) of the batch members at the indices members
+
+    rhs maps states of shape (species, len(members)) to their derivatives, jac maps them to the block diagonal
+    Jacobian of the stacked system: the dense blocks, shape (len(members), species, species), for models with up to
+    DENSE_MAX_SPECIES species, otherwise one sparse matrix (species-major like EnsembleModel). CompiledModel (also with a parameter
+    batch) and EnsembleModel evaluate the whole batch in one call, other models (generated modules,
+    backends.NumbaModel) are evaluated member by member and need an analytic jac.
+    """
+    if isinstance(model, compiler.EnsembleModel):
+        model = model.model
+    if isinstance(model, compiler.CompiledModel):
+        def compiled_functions(members):
+            selected = model.select_parameters(members) if model.alpha.ndim > 1 else model
+            if model.n_species <= DENSE_MAX_SPECIES:
+                return (lambda y: selected.rhs(0, y)), selected.jac_batch
+            ensemble = compiler.EnsembleModel(selected, batch_size=len(members))
+            return (lambda y: selected.rhs(0, y)), (lambda y: ensemble.jac_sparse(0, y.ravel()))
+        return compiled_functions
+    if not hasattr(model, 'jac'):
+        raise Exception("The model has no analytic Jacobian, regenerate it with grn.generate_model")
+    def rhs(y):
+        return np.stack([model.solve_model(0, y[:, b]) for b in range(y.shape[1])], axis=1)
+    def jac(y):
+        n_species, batch = y.shape
+        blocks = sp.block_diag([model.jac(0, y[:, b]) for b in range(batch)], format='csr')
+        # member-major -> species-major
+        order: npt.NDArray = (np.arange(batch)[None, :] * n_species + np.arange(n_species)[:, None]).ravel()
+        return sp.csc_matrix(blocks[order][:, order])
+    return lambda members: (rhs, jac)
+
+
+def rms_norm(x: npt.NDArray) -> npt.NDArray:
+    # per batch member (columns)
+    return np.sqrt(np.mean(x ** 2, axis=0))
+
+
+def select_initial_step(y: npt.NDArray, f: npt.NDArray, rtol: float, atol: float) -> npt.NDArray:
+    scale: npt.NDArray = atol + rtol * np.abs(y)
+    d0: npt.NDArray = rms_norm(y / scale)
+    d1: npt.NDArray = rms_norm(f / scale)
+    return np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01 * d0 / np.maximum(d1, 1e-300))
+
+
+def hermite(theta: npt.NDArray, h: npt.NDArray, y0: npt.NDArray, f0: npt.NDArray, y1: npt.NDArray, f1: npt.NDArray) -> npt.NDArray:
+    """Cubic Hermite interpolant over a step, theta in [0, 1]"""
+    t2: npt.NDArray = theta ** 2
+    t3: npt.NDArray = theta ** 3
+    return (2*t3 - 3*t2 + 1) * y0 + (t3 - 2*t2 + theta) * h * f0 + (3*t2 - 2*t3) * y1 + (t3 - t2) * h * f1
+
+
+def factorize(J, h: npt.NDArray):
+    """solve(v) for W = I - h*GAMMA*J, v of shape (species, members) and h the step sizes of the members"""
+    if sp.issparse(J):
+        # stacked species-major: every row is scaled by the step size of its member
+        h_stacked: npt.NDArray = np.tile(h, J.shape[0] // len(h))
+        lu = scipy.sparse.linalg.splu(sp.csc_matrix(sp.identity(J.shape[0]) - sp.diags(h_stacked * GAMMA) @ J))
+        return lambda v: lu.solve(v.ravel()).reshape(v.shape)
+    W_inv: npt.NDArray = np.linalg.inv(np.eye(J.shape[1]) - (h * GAMMA)[:, None, None] * J)
+    return lambda v: np.einsum('bij,jb->ib', W_inv, v)
+
+
+def rosenbrock_samples(functions, t_span, Y0: npt.NDArray, T, rtol: float = 1e-3, atol: float = 1e-6, steady_tol: float | None = None, first_step=None, max_step: float = np.inf, check_budget=None):
+    """Integrate a batch of independent autonomous systems with a vectorized Rosenbrock (ode23s) scheme
+
+    Y0 has shape (species, batch), functions is batch_functions(model). Every member has its own time and step size;
+    each iteration takes one step for all running members with three batched rhs calls and one factorization of the
+    block diagonal Jacobian of the stacked system (see batch_functions). Members that reached t_span[1] (or settled)
+    drop out of the batch. Samples at the sorted times T are interpolated with the
+    cubic Hermite interpolant of the step. With steady_tol a member stops after a step over which max |dy/dt|
+    (secant) and max |dy/dt| at its end (the rhs of the step's last stage) are below steady_tol and holds its state
+    (see simulator.integrate_samples). check_budget(nfev) is called
+    after every step (see simulator.check_solver_budget).
+    Returns (Y of shape (batch, len(T), species), t_settle of shape (batch,), stats).
+    """
+    t0, t_end = t_span
+    T = np.asarray(T, dtype=float)
+    y: npt.NDArray = np.array(Y0, dtype=float)
+    n_species, batch = y.shape
+
+    members: npt.NDArray = np.arange(batch)
+    rhs, jac = functions(members)
+    t: npt.NDArray = np.full(batch, float(t0))
+    f: npt.NDArray = rhs(y)
+    nfev, njev, nlu, n_steps = 1, 0, 0, 0
+    h: npt.NDArray = np.broadcast_to(select_initial_step(y, f, rtol, atol) if first_step is None else first_step, batch).astype(float)
+    h = np.minimum(h, max_step)
+    running: npt.NDArray = np.ones(batch, dtype=bool)
+    failed: npt.NDArray = np.zeros(batch, dtype=bool)
+
+    Y: npt.NDArray = np.empty((batch, len(T), n_species))
+    k: npt.NDArray = np.full(batch, np.searchsorted(T, t0, side='right'))
+    Y[:, :k[0]] = y.T[:, None]
+
+    while True:
+        running &= (t < t_end) & (k < len(T))
+        if not running.any():
+            break
+        if not np.array_equal(members, np.flatnonzero(running)):
+            members = np.flatnonzero(running)
+            rhs, jac = functions(members)
+        h_m: npt.NDArray = np.minimum(h[members], t_end - t[members])
+        t_m, y_m, f_m, k_m = t[members], y[:, members], f[:, members], k[members]
+
+        # W = I - h*gamma*J factorized once and applied to the three stages
+        solve = factorize(jac(y_m), h_m)
+        njev += 1
+        nlu += 1
+
+        k1: npt.NDArray = solve(f_m)
+        f1: npt.NDArray = rhs(y_m + 0.5 * h_m * k1)
+        k2: npt.NDArray = solve(f1 - k1) + k1
+        y_new: npt.NDArray = y_m + h_m * k2
+        f_new: npt.NDArray = rhs(y_new)
+        k3: npt.NDArray = solve(f_new - E32 * (k2 - f1) - 2 * (k1 - f_m))
+        nfev += 2
+        n_steps += 1
+        if check_budget is not None:
+            check_budget(nfev)
+
+        scale: npt.NDArray = atol + rtol * np.maximum(np.abs(y_m), np.abs(y_new))
+        error: npt.NDArray = rms_norm(h_m / 6 * (k1 - 2 * k2 + k3) / scale)
+        accepted: npt.NDArray = error <= 1
+        t_new: npt.NDArray = t_m + h_m
+
+        # samples within the accepted steps, as (member, sample) pairs
+        counts: npt.NDArray = np.where(accepted, np.searchsorted(T, t_new, side='right'), k_m) - k_m
+        if counts.any():
+            pair: npt.NDArray = np.repeat(np.arange(len(members)), counts)
+            samples: npt.NDArray = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + k_m[pair]
+            theta: npt.NDArray = (T[samples] - t_m[pair]) / h_m[pair]
+            Y[members[pair], samples] = hermite(theta, h_m[pair], y_m[:, pair], f_m[:, pair], y_new[:, pair], f_new[:, pair]).T
+            k[members] += counts
+
+        if steady_tol is not None:
+            settled: npt.NDArray = accepted & (np.max(np.abs(y_new - y_m), axis=0) < steady_tol * h_m) & (np.max(np.abs(f_new), axis=0) < steady_tol)
+            running[members[settled]] = False
+
+        t[members] = np.where(accepted, t_new, t_m)
+        y[:, members] = np.where(accepted, y_new, y_m)
+        f[:, members] = np.where(accepted, f_new, f_m)
+
+        factor: npt.NDArray = SAFETY * np.maximum(error, 1e-10) ** (-1 / 3)
+        h[members] = np.minimum(h_m * np.clip(factor, MIN_FACTOR, np.where(accepted, MAX_FACTOR, 1.0)), max_step)
+        too_small: npt.NDArray = h < 10 * np.abs(np.nextafter(t, np.inf) - t)
+        failed |= running & too_small
+        running &= ~too_small
+
+    for b in range(batch):
+        Y[b, k[b]:] = y[:, b]
+    status: str = 'failed' if failed.any() else 'finished'
+    stats: dict = {'nfev': nfev, 'njev': njev, 'nlu': nlu, 'n_steps': n_steps, 'status': status}
+    return Y, t, stats
+
+
+def integrate_samples(model, t_span, y0, T, method='Rosenbrock', steady_tol=None, **kwargs):
+    """simulator.integrate_samples for the methods in METHODS
+
+    An EnsembleModel is integrated as its batch of independent members (each with its own step size), anything else
+    as a batch of one. Returns (Y of shape (len(T), species), t_settle, stats) like simulator.integrate_samples;
+    for an ensemble Y is stacked and t_settle is the time the last member stopped at.
+    """
+    if method not in METHODS:
+        raise Exception(f"Invalid method: expected one of {METHODS}, got {method}")
+    functions = batch_functions(model)
+    y0 = np.asarray(y0, dtype=float)
+    batch: int = model.batch_size if isinstance(model, compiler.EnsembleModel) else 1
+    Y, t_settle, stats = rosenbrock_samples(functions, t_span, y0.reshape(-1, batch), T, steady_tol=steady_tol, **kwargs)
+    # (batch, samples, species) -> stacked species-major, as EnsembleModel.stack
+    Y = np.moveaxis(Y, 0, 2).reshape(len(Y[0]), -1)
+    return Y, np.max(t_settle), stats
+
@@ -9,3 +9,13 @@ def solve_model(T,state):
 
 def solve_model_steady(state):
     return solve_model(0, state)
+
+def jac(T,state):
+    X1, X2, Y = state
+    J = np.zeros((3, 3))
+    J[0, 0] += -0
+    J[1, 1] += -0
+    J[2, 2] += -0.1
+    J[2, 0] += 10*((0)*((1+((X1/5)**2))*(1+((X2/5)**3)))-(((X2/5)**3))*((1+((X2/5)**3))))/(((1+((X1/5)**2))*(1+((X2/5)**3)))**2)*(2/5)*((X1/5)**(2-1))+10*((1)*((1+((X1/5)**2))*(1+((X2/5)**3)))-(((X1/5)**2))*((1+((X2/5)**3))))/(((1+((X1/5)**2))*(1+((X2/5)**3)))**2)*(2/5)*((X1/5)**(2-1))
+    J[2, 1] += 10*((1)*((1+((X1/5)**2))*(1+((X2/5)**3)))-(((X2/5)**3))*((1+((X1/5)**2))))/(((1+((X1/5)**2))*(1+((X2/5)**3)))**2)*(3/5)*((X2/5)**(3-1))+10*((0)*((1+((X1/5)**2))*(1+((X2/5)**3)))-(((X1/5)**2))*((1+((X1/5)**2))))/(((1+((X1/5)**2))*(1+((X2/5)**3)))**2)*(3/5)*((X2/5)**(3-1))
+    return J
@@ -1,9 +1,18 @@
 import numpy as np
+import numpy.typing as npt
 import importlib
 import matplotlib.pyplot as plt
-from scipy.integrate import solve_ivp
+from scipy.integrate import solve_ivp, LSODA, BDF, Radau, RK45, RK23, DOP853
+import scipy.optimize
 import pandas as pd
 import os 
+import time
+import contextlib
+from typing import Literal, overload
+import networkx as nx
+import compiler
+import backends
+import integrators
 
 def get_model_name() -> str:
     return f"models/model_pid_{os.getpid()}"
@@ -11,6 +20,202 @@ def get_model_name() -> str:
 def get_model_file() -> str:
     return f"{get_model_name()}.py"
 
+def load_model(grn, model=False, backend='numpy'):
+    """Resolve the model argument of the simulation functions
+
+    model can be False (compile grn with the given backend, see backends.load_backend), a CompiledModel, a module
+    name written by grn.generate_model, an already imported model module or any callable with signature (T, state).
+    """
+    if type(model) == bool:
+        with phase('compile'):
+            model = backends.load_backend(grn, backend)
+    if type(model) == str:
+        # read the model module    
+        with phase('import'):
+            model_module = importlib.import_module(model.replace(os.sep,'.')) 
+            model = importlib.reload(model_module) 
+    return model
+
+# solvers that can factorize a sparse Jacobian (jac_sparsity / sparse jac)
+SPARSE_METHODS = ('BDF', 'Radau')
+
+def get_rhs_and_jac(model, sparse=False):
+    """Return (solve_model, jac) of a resolved model, jac is None if the model does not provide one
+
+    With sparse=True the sparse analytic Jacobian (jac_sparse) is preferred when the model provides it.
+    """
+    if hasattr(model, 'solve_model'):
+        if sparse and hasattr(model, 'jac_sparse'):
+            return model.solve_model, model.jac_sparse
+        return model.solve_model, getattr(model, 'jac', None)
+    return model, None
+
+# solve_ivp methods, for stepping the solvers directly in integrate_samples
+SOLVERS = {'LSODA': LSODA, 'BDF': BDF, 'Radau': Radau, 'RK45': RK45, 'RK23': RK23, 'DOP853': DOP853}
+
+def solver_arguments(model, method='LSODA', sparse_jac=True, **kwargs):
+    """(rhs, solver options) that pass the analytic Jacobian of the model when available
+
+    With BDF/Radau the Jacobian is sparse: either the sparse analytic Jacobian (sparse_jac=True) or finite
+    differences restricted to the model's jac_sparsity pattern.
+    """
+    sparse = method in SPARSE_METHODS
+    rhs, jac = get_rhs_and_jac(model, sparse=sparse)
+    if sparse and not sparse_jac and hasattr(model, 'jac_sparsity'):
+        kwargs['jac_sparsity'] = model.jac_sparsity
+    elif jac is not None:
+        kwargs['jac'] = jac
+    return rhs, kwargs
+
+def solve(model, t_span, y0, method='LSODA', sparse_jac=True, **kwargs):
+    """solve_ivp that passes the analytic Jacobian of the model when available
+
+    LSODA (default) is used since this is a stiff problem.
+    """
+    rhs, kwargs = solver_arguments(model, method, sparse_jac, **kwargs)
+    return solve_ivp(rhs, t_span, y0, method=method, **kwargs)
+
+# solver statistics summed over all integrate_samples calls of this process since the last reset_solver_stats
+SOLVER_STATS = {'nfev': 0, 'njev': 0, 'nlu': 0, 'n_steps': 0}
+
+def reset_solver_stats():
+    for key in SOLVER_STATS:
+        SOLVER_STATS[key] = 0
+
+def record_solver_stats(stats):
+    for key in SOLVER_STATS:
+        SOLVER_STATS[key] += int(stats[key])
+
+# limits of the integrate_samples calls of this process, see set_solver_budget
+SOLVER_BUDGET = {'max_nfev': None, 'deadline': None}
+
+def set_solver_budget(max_nfev=None, max_time=None):
+    """Limit the integrate_samples calls from now on to max_nfev rhs evaluations in total (counted in SOLVER_STATS,
+    so reset_solver_stats first) and to max_time seconds of wall-clock time; integration beyond either limit raises
+    TimeoutError. None lifts a limit."""
+    SOLVER_BUDGET['max_nfev'] = max_nfev
+    SOLVER_BUDGET['deadline'] = None if max_time is None else time.perf_counter() + max_time
+
+def check_solver_budget(nfev=0):
+    # nfev: evaluations of the running integration, not yet recorded in SOLVER_STATS
+    if SOLVER_BUDGET['max_nfev'] is not None and SOLVER_STATS['nfev'] + nfev > SOLVER_BUDGET['max_nfev']:
+        raise TimeoutError(f"Solver budget exceeded: more than {SOLVER_BUDGET['max_nfev']} rhs evaluations")
+    if SOLVER_BUDGET['deadline'] is not None and time.perf_counter() > SOLVER_BUDGET['deadline']:
+        raise TimeoutError("Solver budget exceeded: out of time")
+
+# statistics of the active instrument blocks (innermost last) and their callbacks, see instrument
+INSTRUMENTS = []
+
+@contextlib.contextmanager
+def instrument(callback=None):
+    """Collect per-phase statistics of everything run inside the with block (opt-in, phases are only timed while
+    a block is active)
+
+    Yields a dict {phase: {'calls', 'time', ...}} that is filled as the phases finish: 'time' is their wall-clock
+    time in seconds, the 'integrate' phase also sums the solver statistics (nfev, njev, nlu, n_steps) and counts
+    'failed' integrations. The phases are 'build' (circuit construction), 'generate_model' (writing a model module),
+    'compile' (compiling a backend model), 'import' (importing a model module), 'integrate', 'prescreen' and
+    'postprocess' (reading the outputs off the states); phases can nest, e.g. 'compile' runs within 'build' when
+    the circuit is built from a template. callback(phase, seconds, info) is called after every phase, info holds the
+    statistics of that call (e.g. the solver statistics and 'status' of an integration).
+    Blocks can nest, every active block collects all phases.
+    """
+    stats = {}
+    INSTRUMENTS.append((stats, callback))
+    try:
+        yield stats
+    finally:
+        INSTRUMENTS.remove((stats, callback))
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the with block as phase name for the active instrument blocks; yields a dict the block can add the
+    statistics of the call to (numeric values are summed per phase)"""
+    if not INSTRUMENTS:
+        yield {}
+        return
+    info = {}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - start
+        for stats, callback in list(INSTRUMENTS):
+            add_phase_stats(stats, {name: {'calls': 1, 'time': seconds, **info}})
+            if callback is not None:
+                callback(name, seconds, info)
+
+def add_phase_stats(total, stats):
+    """Add the phase statistics stats (of instrument) to total, e.g. to aggregate the statistics of several
+    workers; non-numeric values (an integration's status) are skipped"""
+    for name, values in stats.items():
+        phase_total = total.setdefault(name, {})
+        for key, value in values.items():
+            if isinstance(value, (int, float, np.number)):
+                phase_total[key] = phase_total.get(key, 0) + value
+    return total
+
+def print_phase_stats(stats):
+    # nested phases are included in the time of the phase they ran in, so the times don't add up to a total
+    for name, values in sorted(stats.items(), key=lambda item: -item[1]['time']):
+        solver_stats = ''.join(f", {key}={values[key]:.0f}" for key in (*SOLVER_STATS, 'failed') if values.get(key))
+        print(f"{name:<16} {values['time']:10.3f} s, calls={values['calls']:.0f}{solver_stats}")
+
+def integrate_samples(model, t_span, y0, T, method='LSODA', steady_tol=None, sparse_jac=True, **kwargs):
+    """Step the solver over t_span and record the states at the sorted times T only
+
+    Samples are interpolated from each step's dense output, as solve_ivp(dense_output=True).sol(T) would.
+    With steady_tol, integration stops after the first step over which max |dy/dt| (secant over the step) is below
+    steady_tol and at whose end max |dy/dt| (the rhs, one extra evaluation) is below steady_tol too, the final state
+    is held for the remaining samples. The secant alone would accept a step that jumps over an extremum.
+    Returns (Y of shape (len(T), species), t_settle, stats); t_settle is the time integration stopped at.
+    method='Rosenbrock' uses the batched integrator of integrators.py (an EnsembleModel is integrated member by member).
+    The stats are also added to SOLVER_STATS, and the budget of set_solver_budget is checked after every step.
+    The call is timed as the 'integrate' phase of the active instrument blocks, with its stats.
+    """
+    with phase('integrate') as info:
+        Y, t_settle, stats = step_samples(model, t_span, y0, T, method=method, steady_tol=steady_tol, sparse_jac=sparse_jac, **kwargs)
+        info.update(stats)
+        info['failed'] = int(stats['status'] == 'failed')
+    return Y, t_settle, stats
+
+def step_samples(model, t_span, y0, T, method='LSODA', steady_tol=None, sparse_jac=True, **kwargs):
+    # integrate_samples without the instrumentation
+    if method in integrators.METHODS:
+        Y, t_settle, stats = integrators.integrate_samples(model, t_span, y0, T, method=method, steady_tol=steady_tol, check_budget=check_solver_budget, **kwargs)
+        record_solver_stats(stats)
+        return Y, t_settle, stats
+    rhs, kwargs = solver_arguments(model, method, sparse_jac, **kwargs)
+    solver = SOLVERS[method](rhs, t_span[0], np.array(y0, dtype=float), t_span[1], **kwargs)
+
+    T = np.asarray(T)
+    Y = np.empty((len(T), len(solver.y)))
+    k = np.searchsorted(T, t_span[0], side='right')
+    Y[:k] = solver.y
+    n_steps = 0
+    # rhs evaluations of the steady state test
+    n_checks = 0
+
+    while solver.status == 'running' and k < len(T):
+        t_old, y_old = solver.t, solver.y.copy()
+        if solver.step() is not None or solver.status == 'failed':
+            break
+        n_steps += 1
+        check_solver_budget(solver.nfev)
+        if T[k] <= solver.t:
+            k_new = np.searchsorted(T, solver.t, side='right')
+            Y[k:k_new] = solver.dense_output()(T[k:k_new]).T
+            k = k_new
+        if steady_tol is not None and np.max(np.abs(solver.y - y_old)) < steady_tol * (solver.t - t_old):
+            n_checks += 1
+            if np.max(np.abs(rhs(solver.t, solver.y))) < steady_tol:
+                break
+
+    Y[k:] = solver.y
+    stats = {'nfev': solver.nfev + n_checks, 'njev': solver.njev, 'nlu': solver.nlu, 'n_steps': n_steps, 'status': solver.status}
+    record_solver_stats(stats)
+    return Y, solver.t, stats
+
 def generate_bin_vectors(INS_num):
     vects = []
     
@@ -21,53 +226,49 @@ def generate_bin_vectors(INS_num):
         
     return np.array(vects)
 
-def get_steady(grn, model=False, rep_num=1, INS_def=False, INS_factor=1, eps=10**(-3)):
-    if type(model) == bool:
-        grn.generate_model()
-        model = 'model'
-    if type(model) == str:
-        # read the model module    
-        model_module = importlib.import_module(model.replace(os.sep,'.')) 
-        model_module = importlib.reload(model_module) 
-        model = model_module.solve_model
+def get_steady(grn, model=False, rep_num=1, INS_def=False, INS_factor=1, eps=10**(-3), method='LSODA', solver='root', return_info=False, backend='numpy'):
+    model = load_model(grn, model, backend)
 
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
 
 
-    if INS_def:         
+    if type(INS_def) != bool:         
         INS = INS_def
     else:
         INS = generate_bin_vectors(n_INS) * INS_factor
 
 
     STATES = []
+    INFOS = []
 
     for _ in range(rep_num):
         R0 = np.random.random(n_RS)
 
         for X0 in INS:
             
-            states = get_steady_single(grn, model, X0, plot_on=False, eps=eps, R0=R0)
+            states, info = get_steady_single(grn, X0, model, plot_on=False, eps=eps, R0=R0, method=method, solver=solver, return_info=True)
             STATES.append(states[-1])
+            INFOS.append(info)
 
 
     df = pd.DataFrame(STATES)
     df.columns = grn.species_names
 
+    if return_info:
+        return df, pd.DataFrame(INFOS)
     return df
 
 
-def get_steady_single(grn, IN, model=False, INS_factor=1, plot_on=True, legend=True, eps=10**(-3), R0=False, xlabel='time [a.u.]', ylabel='concentrations [a.u.]'):
-    # read the model module    
-    
-    if type(model) == bool:
-        grn.generate_model()
-        model = 'model'
-    if type(model)==str:
-        model_module = importlib.import_module(model.replace(os.sep,'.')) 
-        model_module = importlib.reload(model_module) 
-        model = model_module.solve_model
+def get_steady_single(grn, IN, model=False, INS_factor=1, plot_on=True, legend=True, eps=10**(-3), R0=False, xlabel='time [a.u.]', ylabel='concentrations [a.u.]', method='LSODA', solver='root', return_info=False, backend='numpy'):
+    """Steady state for inputs IN
+
+    solver='root' (default) uses find_steady_state: a short warm-up integration followed by root finding on
+    solve_model_steady, with pseudo-transient continuation and integration as fallbacks. solver='integrate'
+    integrates in windows of 1 time unit until successive samples differ by less than eps.
+    With return_info=True, (states, info) is returned, where info holds the convergence diagnostics.
+    """
+    model = load_model(grn, model, backend)
 
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
@@ -78,48 +279,191 @@ def get_steady_single(grn, IN, model=False, INS_factor=1, plot_on=True, legend=T
         R0 = np.random.random(n_RS)
         
     S0 = np.append(X0,R0)
+
+    if solver == 'root':
+        states, info = find_steady_state(model, S0, n_INS, eps=eps, method=method)
+    elif solver == 'integrate':
+        states, info = integrate_to_steady_state(model, S0, eps=eps, method=method)
+    else:
+        raise Exception(f"Invalid steady state solver: {solver}")
+
+    if plot_on:
+        plt.plot(states)
+        if legend:
+            plt.legend(grn.species_names)
+
+        plt.xlabel(xlabel)
+        plt.ylabel(ylabel)
+
+        plt.show()
+
+    if return_info:
+        return states, info
+    return states
+
+
+def integrate_to_steady_state(model, S0, eps=10**(-3), method='LSODA', max_windows=None):
     states = [S0]
 
     t_step = 1
     dt = 0.1
     T = np.arange(0, t_step+dt, dt)
+    windows = 0
+    nfev = 0
+    converged = False
 
+    while max_windows is None or windows < max_windows:
 
-    while True:
-
-        sol = solve_ivp(model, [0, t_step], states[-1], dense_output=True, method='LSODA') # gre za stiff problem, uporaba LSODA
+        sol = solve(model, [0, t_step], states[-1], method=method, dense_output=True)
         z = sol.sol(T)
         Y = z.T
+        windows += 1
+        nfev += sol.nfev
         
         
         if np.max(np.abs(Y[-2]-Y[-1])) < eps:
+            converged = True
             break
 
 
         states.append(Y[-1])
 
-    if plot_on:
-        plt.plot(states)
-        if legend:
-            plt.legend(grn.species_names)
-
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-
-        plt.show()
-
-    return states
-
+    rhs, _ = get_rhs_and_jac(model)
+    residual = float(np.max(np.abs(rhs(0, states[-1])), initial=0))
+    return states, {'solver': 'integrate', 'converged': converged, 'residual': residual, 'iterations': windows, 'nfev': nfev, 't_integrated': windows*t_step}
+
+
+def numerical_jac(rhs, state, h=1e-7):
+    """Forward-difference Jacobian, for models that don't provide an analytic one"""
+    f0 = rhs(0, state)
+    J = np.zeros((len(state), len(state)))
+    for j in range(len(state)):
+        step = h*max(1.0, abs(state[j]))
+        shifted = np.array(state, dtype=float)
+        shifted[j] += step
+        J[:, j] = (rhs(0, shifted) - f0) / step
+    return J
+
+
+def find_steady_state(model, S0, n_INS, eps=10**(-3), method='LSODA', t_warmup=10, max_iter=200):
+    """Steady state by root finding on solve_model_steady with the inputs (first n_INS species) held fixed
+
+    1. integrate for t_warmup to move into the basin of attraction of the state the dynamics settle in
+    2. hybrid Powell root finding (scipy.optimize.root) with the analytic Jacobian, accepted if the residual is below
+       eps, the state is non-negative and stable
+    3. otherwise pseudo-transient continuation (R += (I/dt - J)^-1 F, dt grows as the residual shrinks)
+    4. otherwise integrate_to_steady_state
+    Returns (states, info); states are [S0, warm-up state, steady state] and info holds the convergence diagnostics.
+    """
+    rhs, jac = get_rhs_and_jac(model)
+    if jac is None:
+        jac = lambda T, state: numerical_jac(rhs, state)
+
+    nfev = 0
+    njev = 0
+    def F(R):
+        nonlocal nfev
+        nfev += 1
+        return rhs(0, np.append(X, R))[n_INS:]
+    def J(R):
+        nonlocal njev
+        njev += 1
+        return jac(0, np.append(X, R))[n_INS:, n_INS:]
+    def info(solver, converged, R, iterations):
+        return {'solver': solver, 'converged': converged, 'residual': float(np.max(np.abs(F(R)), initial=0)), 'iterations': iterations, 'nfev': nfev, 'njev': njev, 't_integrated': t_warmup}
+    def acceptable(R):
+        if np.max(np.abs(F(R)), initial=0) >= eps or np.min(R, initial=0) < -eps:
+            return False
+        eigenvalues = np.linalg.eigvals(J(R)) if len(R) else np.zeros(0)
+        return bool(np.all(eigenvalues.real <= 0))
+
+    S0 = np.array(S0, dtype=float)
+    X = S0[:n_INS]
+    sol = solve(model, [0, t_warmup], S0, method=method)
+    nfev += sol.nfev
+    S_warm = sol.y[:, -1]
+    R = S_warm[n_INS:]
+
+    # Newton-type (hybrid) root finding
+    root = scipy.optimize.root(F, R, jac=J, method='hybr')
+    if root.success and acceptable(root.x):
+        return [S0, S_warm, np.append(X, root.x)], info('root', True, root.x, root.nfev)
+
+    # Pseudo-transient continuation
+    dt = 1.0
+    residual = np.max(np.abs(F(R)), initial=0)
+    for iteration in range(1, max_iter+1):
+        A = np.eye(len(R))/dt - J(R)
+        R = R + np.linalg.solve(A, F(R))
+        residual_new = np.max(np.abs(F(R)), initial=0)
+        if residual_new < eps and acceptable(R):
+            return [S0, S_warm, np.append(X, R)], info('ptc', True, R, iteration)
+        # switched evolution relaxation: larger steps as the residual decreases
+        dt = min(dt * max(residual / max(residual_new, 1e-300), 0.5), 1e12)
+        residual = residual_new
+        if not np.all(np.isfinite(R)):
+            break
 
-def simulate_single(grn, IN, model=False, INS_factor=1, t_end=100, plot_on=True, legend=True, R0=False, xlabel='time [a.u.]', ylabel='concentrations [a.u.]'):
-    if type(model) == bool:
-        grn.generate_model()
-        model = 'model'
-    if type(model)==str:        
-        # read the model module    
-        model_module = importlib.import_module(model.replace(os.sep,'.')) 
-        model_module = importlib.reload(model_module) 
-        model = model_module.solve_model
+    # Integration as the last resort
+    states, integration_info = integrate_to_steady_state(model, S_warm, eps=eps, method=method)
+    integration_info['nfev'] += nfev
+    integration_info['t_integrated'] += t_warmup
+    return [S0] + states, integration_info
+
+
+def get_quasi_steady_states(grn, IN_seq, INS_factor=1):
+    """Steady states of an acyclic network for every input vector of IN_seq, without integrating
+
+    The species are visited stage by stage (grn.get_stages), every species' steady state is the production rate of
+    its genes at the steady states of its regulators divided by its delta. This is exact for acyclic networks (their
+    steady state is unique), so it predicts what simulate_sequence settles to when t_single is long enough.
+    Species with delta 0 have no steady state if they are produced (NaN, which spreads to the species they regulate).
+    Returns shape (len(IN_seq), species).
+    """
+    if not nx.is_directed_acyclic_graph(grn.get_regulation_graph()):
+        raise Exception("Quasi-steady states need an acyclic network")
+    model = grn.compile_model()
+    n_INS = len(grn.input_species_names)
+    inputs = np.array([grn.species_index[name] for name in grn.input_species_names], dtype=np.intp)
+    Y = np.zeros((model.n_species, len(IN_seq)))
+    Y[inputs] = (np.array(IN_seq, dtype=float).reshape(-1, n_INS) * INS_factor).T
+
+    for stage in grn.get_stages():
+        indices = np.setdiff1d(stage, inputs)
+        if not len(indices):
+            continue
+        production = model.production[indices] @ model.gene_rates(Y)
+        delta = model.delta[indices, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Y[indices] = np.where(delta > 0, production / delta, np.where(production == 0, 0.0, np.nan))
+    return Y.T
+
+
+def get_phase_sample_times(t_samples, n_phases, t_single):
+    """Sample times within each phase: every integer time (None), the end of the phase ('end'), or t_samples[i]
+    (a time or a sorted list of times) for phase i"""
+    if t_samples is None:
+        return [np.arange(0, t_single+1)]*n_phases
+    if type(t_samples) == str and t_samples == 'end':
+        return [np.array([t_single])]*n_phases
+    if len(t_samples) != n_phases:
+        raise Exception(f"Expected sample times for {n_phases} phases, got {len(t_samples)}")
+    return [np.atleast_1d(t) for t in t_samples]
+
+
+# the settle time is only returned on request, so that T,Y = simulate_single(...) keeps its type
+@overload
+def simulate_single(grn, IN, model=..., INS_factor=..., t_end=..., plot_on=..., legend=..., R0=..., xlabel=..., ylabel=..., method=..., steady_tol=..., *, return_settle_time: Literal[False] = False, t_samples=..., backend=...) -> tuple[npt.NDArray, npt.NDArray]: ...
+@overload
+def simulate_single(grn, IN, model=..., INS_factor=..., t_end=..., plot_on=..., legend=..., R0=..., xlabel=..., ylabel=..., method=..., steady_tol=..., *, return_settle_time: Literal[True], t_samples=..., backend=...) -> tuple[npt.NDArray, npt.NDArray, float]: ...
+
+def simulate_single(grn, IN, model=False, INS_factor=1, t_end=100, plot_on=True, legend=True, R0=False, xlabel='time [a.u.]', ylabel='concentrations [a.u.]', method='LSODA', steady_tol=None, return_settle_time=False, t_samples=None, backend='numpy'):
+    """Simulate inputs IN for t_end time units, sampled at every integer time or at the sorted times t_samples
+
+    With steady_tol, integration stops once max |dy/dt| < steady_tol and the final state is held for the remaining
+    samples; return_settle_time=True additionally returns the time at which it stopped (t_end if it didn't).
+    """
+    model = load_model(grn, model, backend)
 
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
@@ -129,11 +473,9 @@ def simulate_single(grn, IN, model=False, INS_factor=1, t_end=100, plot_on=True,
         R0 = np.random.random(n_RS)
         
     S0 = np.append(X0,R0)
+    T = np.arange(0, t_end+1) if t_samples is None else np.asarray(t_samples)
 
-    sol = solve_ivp(model, [0, t_end], S0, dense_output=True, method='LSODA') # gre za stiff problem, uporaba LSODA
-    T = np.arange(0, t_end+1)
-    z = sol.sol(T)
-    Y = z.T
+    Y, t_settle, _ = integrate_samples(model, [0, t_end], S0, T, method=method, steady_tol=steady_tol)
 
     if plot_on:
         plt.plot(T,Y)
@@ -145,44 +487,121 @@ def simulate_single(grn, IN, model=False, INS_factor=1, t_end=100, plot_on=True,
         
         plt.show()
 
+    if return_settle_time:
+        return T,Y,t_settle
     return T,Y
 
 
-def simulate_sequence(grn, IN_seq, model=False, INS_factor=1, t_single=100, plot_on=True, legend=True, xlabel='time [a.u.]', ylabel='concentrations [a.u.]'):
-    if type(model) == bool:
-        grn.generate_model(fname=get_model_file())
-        # model = 'model'
-        model = get_model_name()
-    if type(model)==str:        
-        # read the model module    
-        model_module = importlib.import_module(model.replace(os.sep,'.')) 
-        model_module = importlib.reload(model_module) 
-        model = model_module.solve_model
+@overload
+def simulate_sequence(grn, IN_seq, model=..., INS_factor=..., t_single=..., plot_on=..., legend=..., xlabel=..., ylabel=..., method=..., steady_tol=..., *, return_settle_times: Literal[False] = False, t_samples=..., backend=...) -> tuple[npt.NDArray, npt.NDArray]: ...
+@overload
+def simulate_sequence(grn, IN_seq, model=..., INS_factor=..., t_single=..., plot_on=..., legend=..., xlabel=..., ylabel=..., method=..., steady_tol=..., *, return_settle_times: Literal[True], t_samples=..., backend=...) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]: ...
+
+def simulate_sequence(grn, IN_seq, model=False, INS_factor=1, t_single=100, plot_on=True, legend=True, xlabel='time [a.u.]', ylabel='concentrations [a.u.]', method='LSODA', steady_tol=None, return_settle_times=False, t_samples=None, backend='numpy'):
+    """Simulate the inputs of IN_seq one after another for t_single time units each, carrying the state forward
+
+    By default every phase is sampled at every integer time. t_samples='end' or per-phase sample times (see
+    get_phase_sample_times) record only those samples instead, e.g. one state per phase.
+    steady_tol ends every phase early once max |dy/dt| < steady_tol (see simulate_single);
+    return_settle_times=True additionally returns the settle time of every phase.
+    simulate_sequence_phases yields every phase as soon as it finishes instead.
+    """
+    phases = simulate_sequence_phases(grn, IN_seq, model, INS_factor=INS_factor, t_single=t_single, method=method, steady_tol=steady_tol, t_samples=t_samples, backend=backend)
+
+    phase_T = get_phase_sample_times(t_samples, len(IN_seq), t_single)
+    offsets = np.cumsum([0] + [len(T1) for T1 in phase_T])
+    T = np.empty(offsets[-1])
+    Y = np.empty((offsets[-1], len(grn.species_names)))
+    settle_times = []
+
+    for i, (T1, Y1, t_settle) in enumerate(phases):
+        settle_times.append(t_settle)
+        T[offsets[i]:offsets[i+1]] = T1
+        Y[offsets[i]:offsets[i+1]] = Y1
+
+    if plot_on:
+        plt.plot(T,Y)
+        if legend:
+            plt.legend(grn.species_names)
+
+        plt.xlabel(xlabel)
+        plt.ylabel(ylabel)
+        
+        plt.show()
+
+    if return_settle_times:
+        return T,Y,np.array(settle_times)
+    return T,Y
+
+
+def simulate_sequence_phases(grn, IN_seq, model=False, INS_factor=1, t_single=100, method='LSODA', steady_tol=None, t_samples=None, backend='numpy'):
+    """Generator version of simulate_sequence, yields (T1, Y1, t_settle) of every phase as soon as it is simulated
+
+    T1 are the sample times of the phase (on the time axis of the whole sequence, i.e. shifted by i*t_single), Y1 the
+    states at T1 and t_settle the time within the phase at which integration stopped. Stopping the iteration skips
+    the remaining phases.
+    """
+    model = load_model(grn, model, backend)
 
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
-    R0 = False
+    R0 = np.zeros(n_RS)
 
-    T = False
-    Y = False
+    phase_T = get_phase_sample_times(t_samples, len(IN_seq), t_single)
 
-    for IN in IN_seq:
+    for i, IN in enumerate(IN_seq):
 
         X0 = np.array(IN)*INS_factor
-        if type(R0)==bool:
-            #R0 = np.random.random(n_RS)
-            R0 = np.zeros(n_RS)
-        else:
-            R0 = Y1[-1, -n_RS:]
 
-        T1, Y1 = simulate_single(grn, X0, model, INS_factor=1, t_end=t_single, plot_on=False, R0=R0)
+        # the last sample is the end of the phase, the initial state of the next one
+        T1, Y1, t_settle = simulate_single(grn, X0, model, INS_factor=1, t_end=t_single, plot_on=False, R0=R0, method=method, steady_tol=steady_tol, return_settle_time=True, t_samples=np.append(phase_T[i], t_single))
+        R0 = Y1[-1, n_INS:]
+
+        yield T1[:-1] + i*t_single, Y1[:-1], t_settle
+
+
+def ensemble_tolerances(batch_size, method, rtol=1e-3, atol=1e-6):
+    """(rtol, atol) of a stacked integration (compiler.EnsembleModel) that keep the error of every member within rtol/atol,
+    as separate integrations would
+
+    The scipy solvers control one RMS error norm over the whole stacked state, in which the error of a single member
+    is diluted by sqrt(batch_size); tolerances divided by sqrt(batch_size) bound the norm of every member by 1 again.
+    The integrators of integrators.py control every member on its own and keep rtol/atol.
+    """
+    if method in integrators.METHODS:
+        return rtol, atol
+    scale = np.sqrt(batch_size)
+    return rtol / scale, atol / scale
+
+def simulate_ensemble(grn, IN_seq, model=False, INS_factor=1, t_single=100, plot_on=True, legend=True, xlabel='time [a.u.]', ylabel='concentrations [a.u.]', method='BDF', steady_tol=None, t_samples=None, rtol=1e-3, atol=1e-6):
+    """Integrate all inputs of IN_seq at once as one stacked system (compiler.EnsembleModel)
+
+    Returns T, Y in the layout of simulate_sequence (phases concatenated, t_samples as in simulate_sequence), but
+    every phase starts from R0 = 0 instead of the final state of the previous phase, so the states only agree with
+    simulate_sequence for circuits with a unique steady state per input (delta > 0), not for ones that depend on their
+    history. steady_tol ends the integration once all of them settled.
+    rtol/atol are the tolerances of every input combination; the stacked system is integrated with the tighter
+    ensemble_tolerances, so that each combination is controlled like a separate run (at the cost of more steps).
+    """
+    model = load_model(grn, model)
+    if not isinstance(model, compiler.CompiledModel):
+        raise Exception(f"Ensemble simulation requires a compiled model, got {type(model)}")
+
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+
+    X0 = np.array(IN_seq, dtype=float).reshape(-1, n_INS)*INS_factor
+    S0 = np.hstack([X0, np.zeros((X0.shape[0], n_RS))])
+    ensemble = compiler.EnsembleModel(model, batch_size=X0.shape[0])
 
-        if type(T) == bool:
-            T = T1
-            Y = Y1
-        else:
-            Y = np.concatenate([Y, Y1])
-            T = np.append(T, T1+T[-1])
+    phase_T = get_phase_sample_times(t_samples, X0.shape[0], t_single)
+    T1 = np.unique(np.concatenate(phase_T))
+    rtol, atol = ensemble_tolerances(ensemble.batch_size, method, rtol, atol)
+    samples, _, _ = integrate_samples(ensemble, [0, t_single], ensemble.stack(S0), T1, method=method, steady_tol=steady_tol, rtol=rtol, atol=atol)
+    # (batch, species, time) -> sample times of every phase, phases concatenated along time
+    states = np.swapaxes(ensemble.split(samples.T), 1, 2)
+    Y = np.concatenate([states[i, np.searchsorted(T1, phase_T[i])] for i in range(X0.shape[0])])
+    T = np.concatenate([phase_T[i] + i*t_single for i in range(X0.shape[0])])
 
     if plot_on:
         plt.plot(T,Y)
@@ -194,6 +613,36 @@ def simulate_sequence(grn, IN_seq, model=False, INS_factor=1, t_single=100, plot
         
         plt.show()
 
-    if os.path.exists(get_model_file()):
-        os.remove(get_model_file())
-    return T,Y
\ No newline at end of file
+    return T,Y
+
+
+def simulate_sequence_batch(grn, IN_seq, model, INS_factor=1, t_single=100, t_samples=None, method='BDF', steady_tol=None, rtol=1e-3, atol=1e-6):
+    """simulate_sequence for a parameter-batched model (CompiledModel.with_parameters) in one stacked integration
+
+    Phases run one after another and carry the state forward exactly like simulate_sequence, but every phase
+    integrates all parameter vectors at once. Only the states at t_samples (time within each phase, one per phase,
+    default t_single) are returned, shape (batch, phases, species). With steady_tol a phase ends once the whole
+    batch has settled (see integrate_samples); with method='Rosenbrock' every member has its own step size and
+    stops as soon as it has settled. rtol/atol are the tolerances of every member (see ensemble_tolerances).
+    """
+    batch_size = model.parameter_batch_size
+    ensemble = compiler.EnsembleModel(model, batch_size=batch_size)
+    rtol, atol = ensemble_tolerances(batch_size, method, rtol, atol)
+
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+    if t_samples is None:
+        t_samples = [t_single]*len(IN_seq)
+
+    R0 = np.zeros((batch_size, n_RS))
+    Y = np.zeros((batch_size, len(IN_seq), len(grn.species_names)))
+
+    for i, (IN, t_sample) in enumerate(zip(IN_seq, t_samples)):
+        X0 = np.tile(np.array(IN, dtype=float)*INS_factor, (batch_size, 1))
+        S0 = ensemble.stack(np.hstack([X0, R0]))
+        samples, _, _ = integrate_samples(ensemble, [0, t_single], S0, [t_sample, t_single], method=method, steady_tol=steady_tol, rtol=rtol, atol=atol)
+        states = ensemble.split(samples.T)
+        Y[:, i] = states[:, :, 0]
+        R0 = states[:, n_INS:, -1]
+
+    return Y
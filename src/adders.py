@@ -1,7 +1,8 @@
 import grn
 from src.utils import InputList, OutputList, get_regulators_list_and_products, to_structured_output_string, run_grn
-from src.synthesis import synthesize
+from src.synthesis import circuit_template, synthesize
 
+@circuit_template
 def get_full_adder(param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
     # Initialization
     full_adder: grn.grn = grn.grn()
@@ -42,6 +43,7 @@ def get_full_adder(param_kd: float, param_n: float, param_alpha: float, param_de
         full_adder.add_gene(param_alpha, regulators, products)
     return full_adder
 
+@circuit_template
 def get_half_adder(param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
     # Initialization
     half_adder: grn.grn = grn.grn()
@@ -75,6 +77,7 @@ def get_half_adder(param_kd: float, param_n: float, param_alpha: float, param_de
         half_adder.add_gene(param_alpha, regulators, products)
     return half_adder
 
+@circuit_template
 def get_two_bit_adder(param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
     full_adder: grn.grn = get_full_adder(param_kd, param_n, param_alpha, param_delta)
     half_adder: grn.grn = get_half_adder(param_kd, param_n, param_alpha, param_delta)
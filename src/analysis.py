@@ -1,8 +1,11 @@
 from typing import cast
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 import sys
 import math
 import matplotlib.pyplot as plt
+from src.results import KEY_DECIMALS, PARAM_NAMES, ResultStore, is_result_store, read_log
 
 SPACE_SIZE_COEFFICIENT: float = 20.0
 HSPACE: float = 0.5
@@ -14,46 +17,56 @@ FONTSIZE_TITLE: int = 14
 FONTSIZE_AXIS_LABELS: int = 12
 FONTSIZE_TICK_LABELS: int = 12
 
+# Accuracies of a grid search as a dense array indexed [kd, n, alpha, delta] along the sorted values of each parameter
+AccuracyGrid = tuple[list[npt.NDArray], npt.NDArray]
+
 def read_to_dataframe(filename: str) -> pd.DataFrame:
-    data: list[dict[str, float]] = []
-    with open(filename, "rt") as file:
-        while (line := file.readline().strip()):
-            line = "".join(line.split(":")[1:])
-            params, accuracy = tuple(line.split("->"))
-            params, accuracy = params.strip(), accuracy.strip()
-            data_point: dict[str, float] = {}
-            for param_str in params.split(","):
-                param_str = param_str.strip()
-                param_name, param_value = param_str.split("=")
-                data_point[param_name] = float(param_value)
-            accuracy = float(accuracy.split("=")[1])
-            data_point["accuracy"] = accuracy
-            data.append(data_point)
-    return pd.DataFrame(data)
+    """Grid search results from a result store (src.results) or from a grid search stdout log"""
+    if is_result_store(filename):
+        with ResultStore(filename) as store:
+            return store.to_dataframe()
+    return read_log(filename)
+
+def get_accuracy_grid(content: pd.DataFrame) -> AccuracyGrid:
+    """(values of param_kd, param_n, param_alpha and param_delta, accuracies[kd, n, alpha, delta]) of content, built
+    once so that every plot is a slice; points content doesn't hold are NaN"""
+    values: list[npt.NDArray] = []
+    indices: list[npt.NDArray] = []
+    for name in PARAM_NAMES:
+        param_values, param_indices = np.unique(np.round(content[name].to_numpy(dtype=float), KEY_DECIMALS), return_inverse=True)
+        values.append(param_values)
+        indices.append(param_indices)
+    accuracies: npt.NDArray = np.full([len(param_values) for param_values in values], np.nan)
+    # reversed, so that the first of duplicate points is assigned last (and kept)
+    accuracies[tuple(param_indices[::-1] for param_indices in indices)] = content["accuracy"].to_numpy(dtype=float)[::-1]
+    return values, accuracies
+
+def get_value_indices(values: npt.NDArray, wanted: list[int] | list[float]) -> tuple[npt.NDArray, npt.NDArray]:
+    """(indices into the sorted values, whether the value is there) of every wanted value"""
+    wanted_values: npt.NDArray = np.round(np.asarray(wanted, dtype=float), KEY_DECIMALS)
+    indices: npt.NDArray = np.minimum(np.searchsorted(values, wanted_values), len(values) - 1)
+    return indices, values[indices] == wanted_values
 
-def get_single_plot_data(content: pd.DataFrame, alpha: int, delta: float, param_kd_values: list[int], param_n_values: list[int]) -> list[list[bool]]:
-    plot_data: list[list[bool]] = []
-    for kd in param_kd_values:
-        line: list[bool] = []
-        for n in param_n_values:
-            accuracy: float = content[
-                (content["param_alpha"] == alpha) &
-                (abs(content["param_delta"] - delta) < 1e-5) &
-                (content["param_kd"] == kd) &
-                (content["param_n"] == n)
-            ].iloc[0].accuracy
-            line.append(bool(accuracy >= 1.0))
-        plot_data.append(line)
-    return plot_data
+def get_single_plot_data(grid: AccuracyGrid, alpha: int, delta: float, param_kd_values: list[int], param_n_values: list[int]) -> npt.NDArray:
+    """Whether the points (kd, n) of the plot at alpha and delta work (accuracy 1.0), points missing from the grid
+    don't"""
+    (kd_values, n_values, alpha_values, delta_values), accuracies = grid
+    kd_indices, kd_found = get_value_indices(kd_values, param_kd_values)
+    n_indices, n_found = get_value_indices(n_values, param_n_values)
+    (alpha_index,), (alpha_found,) = get_value_indices(alpha_values, [alpha])
+    (delta_index,), (delta_found,) = get_value_indices(delta_values, [delta])
+    plot_accuracies: npt.NDArray = accuracies[np.ix_(kd_indices, n_indices)][..., alpha_index, delta_index]
+    return (plot_accuracies >= 1.0) & kd_found[:, None] & n_found[None, :] & alpha_found & delta_found
 
 def main():
 
     if len(sys.argv) < 2:
-        print("Usage: python -m src.analysis out.array-2.txt")
+        print("Usage: python -m src.analysis out.array-2.db (or a grid search log, e.g. out.array-2.txt)")
         exit(1)
     # Read file and find working combinations
     filename: str = sys.argv[1]
-    content: pd.DataFrame = read_to_dataframe(filename)
+    content: pd.DataFrame = cast(pd.DataFrame, read_to_dataframe(filename)[[*PARAM_NAMES, "accuracy"]])
+    grid: AccuracyGrid = get_accuracy_grid(content)
     working_combinations: pd.DataFrame = cast(pd.DataFrame, content[content["accuracy"] >= 1.0])
     mean: pd.Series = cast(pd.Series, working_combinations.mean())
     mean_adjusted_std: pd.Series = working_combinations.std() / working_combinations.mean()
@@ -94,7 +107,7 @@ def main():
     plt.subplots_adjust(wspace=WSPACE, hspace=HSPACE)
     for i, delta in enumerate(param_delta_values):
         for j, alpha in enumerate(param_alpha_values):
-            plot_data: list[list[bool]] = get_single_plot_data(content, alpha, delta, param_kd_values, param_n_values)
+            plot_data: npt.NDArray = get_single_plot_data(grid, alpha, delta, param_kd_values, param_n_values)
             axs[i, j].imshow(plot_data, extent=[min(param_n_values), max(param_n_values)+1, min(param_kd_values), max(param_kd_values)+1])
             axs[i, j].set_title(f"{alpha=}, {delta=}", fontsize=FONTSIZE_TITLE)
             axs[i, j].set_xlabel(f"n", fontsize=FONTSIZE_AXIS_LABELS)
@@ -0,0 +1,273 @@
+from typing import Any, Callable
+import grn
+from src.adders import get_full_adder
+from src.multipliers import get_array_multiplier, get_carry_save_multiplier
+from src.utils import INPUT_CONCENTRATION_MAX, INPUT_CONCENTRATION_MIN, T_SINGLE, run_grn
+import src.optimization as optimization
+import src.parser as parser
+import src.synthesis as synthesis
+import src.utils as utils
+import contextlib
+import datetime
+import importlib
+import inspect
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import scipy
+import simulator
+
+# The suite only needs what the original tree has, later additions (backends, the result store, the caches, the
+# solver statistics) are looked up when there and the benchmarks needing them skipped otherwise. Copied into an older
+# checkout it runs there too, which gives the baseline to compare against.
+try:
+    import backends
+except ImportError:
+    backends = None
+try:
+    import src.results as results
+except ImportError:
+    results = None
+
+CONSTRUCTION_SIZES: list[int] = [2, 3, 4, 5, 6]
+SIMULATION_SIZES: list[int] = [2, 3, 4]
+RUN_GRN_SIZES: list[int] = [2, 3]
+# Input combinations of the simulate_sequence benchmarks (all of them for size 2)
+SEQUENCE_PHASES: int = 16
+# Fixed slice of the size 2 parameter grid evaluated by the grid_search benchmark
+GRID_SLICE: dict[str, list] = {"PARAM_KD_VALUES": [5], "PARAM_N_VALUES": [2, 3], "PARAM_ALPHA_VALUES": [10], "PARAM_DELTA_VALUES": [0.1, 0.2]}
+# Wall time is the best of REPEAT runs; peak memory and solver statistics come from one extra run under tracemalloc
+REPEAT: int = 3
+PARAMS: dict[str, float] = {"param_kd": 5, "param_n": 2, "param_alpha": 10, "param_delta": 0.1}
+STEADY_TOL: float | None = getattr(utils, "STEADY_TOL", None)
+
+# Variants every benchmark runs in, as keyword arguments of the benchmarked function; a variant is recorded as the
+# "variant" of its results and skipped where the function doesn't take its arguments.
+# Simulation: "model": "module" simulates the module written by grn.generate_model (the original path, "factored"
+# generates it factored), the others the model compiled by the backend, with the solver method and steady_tol
+SIMULATION_VARIANTS: list[dict[str, Any]] = [
+    {"model": "module"},
+    {"model": "module", "factored": True},
+    {"backend": "numpy"},
+    {"backend": "numpy", "steady_tol": STEADY_TOL},
+    {"backend": "numba", "steady_tol": STEADY_TOL},
+    {"backend": "numpy", "method": "Rosenbrock", "steady_tol": STEADY_TOL},
+]
+CODEGEN_VARIANTS: list[dict[str, Any]] = [{}, {"factored": True}]
+RUN_GRN_VARIANTS: list[dict[str, Any]] = [{}, {"ensemble": True}]
+GRID_SEARCH_VARIANTS: list[dict[str, Any]] = [{}, {"batch_size": 4}]
+
+Benchmark = dict[str, Any]
+
+def get_variant_name(variant: dict[str, Any]) -> str:
+    return ",".join(f"{key}={value}" for key, value in variant.items())
+
+def takes(function: Callable, arguments: dict[str, Any]) -> bool:
+    """Whether function takes all of the keyword arguments"""
+    parameters = inspect.signature(function).parameters
+    return all(name in parameters for name in arguments)
+
+def print_benchmark(benchmark: Benchmark):
+    nfev: str = "-" if benchmark["nfev"] is None else f"{benchmark['nfev']:d}"
+    print(f"{benchmark['name']:<26} size={benchmark['size']!s:<4} {benchmark['variant']:<44} {benchmark['wall_time']*1e3:10.2f} ms {nfev:>8} nfev {benchmark['peak_memory']/2**20:8.2f} MiB", flush=True)
+
+def get_solver_stats() -> dict[str, int | None]:
+    """simulator.SOLVER_STATS, None for trees without it"""
+    solver_stats: dict[str, int] | None = getattr(simulator, "SOLVER_STATS", None)
+    if solver_stats is None:
+        return dict.fromkeys(("nfev", "njev", "nlu", "n_steps"), None)
+    return {key: int(value) for key, value in solver_stats.items()}
+
+def measure(name: str, size: int | None, function: Callable[[], Any], variant: dict[str, Any] | None = None, repeat: int = REPEAT, verbose: bool = True) -> Benchmark:
+    """Wall time (best of repeat runs), solver statistics (simulator.SOLVER_STATS) and peak traced memory of function"""
+    times: list[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    if hasattr(simulator, "reset_solver_stats"):
+        simulator.reset_solver_stats()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark: Benchmark = {"name": name, "size": size, "variant": get_variant_name(variant or {}), "wall_time": min(times), "peak_memory": peak_memory, **get_solver_stats()}
+    if verbose:
+        print_benchmark(benchmark)
+    return benchmark
+
+def benchmark_construction() -> list[Benchmark]:
+    """Circuit construction from scratch (the template and parser caches are cleared before every build)"""
+    clear_caches: list[Callable[[], None]] = [
+        clear for clear in (getattr(synthesis, "clear_template_cache", None), getattr(getattr(parser, "parse_dnf_str_cached", None), "cache_clear", None))
+        if clear is not None
+    ]
+    def build(builder: Callable[..., grn.grn], *args) -> Callable[[], grn.grn]:
+        def function() -> grn.grn:
+            for clear in clear_caches:
+                clear()
+            return builder(*args, **PARAMS)
+        return function
+    benchmarks: list[Benchmark] = [measure("get_full_adder", None, build(get_full_adder))]
+    for size in CONSTRUCTION_SIZES:
+        benchmarks.append(measure("get_array_multiplier", size, build(get_array_multiplier, size)))
+        benchmarks.append(measure("get_carry_save_multiplier", size, build(get_carry_save_multiplier, size)))
+    return benchmarks
+
+def benchmark_code_generation(directory: str) -> list[Benchmark]:
+    """generate_equations, generate_model and the import of the generated module (written to directory)"""
+    benchmarks: list[Benchmark] = []
+    for size in CONSTRUCTION_SIZES:
+        multiplier: grn.grn = get_array_multiplier(size, **PARAMS)
+        for variant in CODEGEN_VARIANTS:
+            if not (takes(multiplier.generate_equations, variant) and takes(multiplier.generate_model, variant)):
+                continue
+            module_name: str = f"model_benchmark_{size}" + "".join(f"_{key}" for key in variant)
+            module_file: str = os.path.join(directory, f"{module_name}.py")
+            benchmarks.append(measure("generate_equations", size, lambda multiplier=multiplier, variant=variant: multiplier.generate_equations(**variant), variant))
+            benchmarks.append(measure("generate_model", size, lambda multiplier=multiplier, module_file=module_file, variant=variant: multiplier.generate_model(fname=module_file, **variant), variant))
+            def import_model(module_name: str = module_name):
+                sys.modules.pop(module_name, None)
+                importlib.invalidate_caches()
+                importlib.import_module(module_name)
+            benchmarks.append(measure("import_model", size, import_model, variant))
+    return benchmarks
+
+def get_simulation_arguments(multiplier: grn.grn, variant: dict[str, Any], directory: str) -> dict[str, Any] | None:
+    """Keyword arguments of simulate_single and simulate_sequence for variant (writes its module to directory), None if
+    this tree can't simulate it"""
+    arguments: dict[str, Any] = {key: value for key, value in variant.items() if key != "factored"}
+    if not takes(simulator.simulate_sequence, arguments):
+        return None
+    if arguments.get("backend") == "numba" and not (backends is not None and backends.numba_available()):
+        return None
+    if arguments.get("model") == "module":
+        generate_arguments: dict[str, Any] = {key: value for key, value in variant.items() if key == "factored"}
+        if not takes(multiplier.generate_model, generate_arguments):
+            return None
+        module_name: str = f"model_simulation_{len(multiplier.species_names)}" + "".join(f"_{key}" for key in generate_arguments)
+        multiplier.generate_model(fname=os.path.join(directory, f"{module_name}.py"), **generate_arguments)
+        arguments["model"] = module_name
+    return arguments
+
+def benchmark_simulation(directory: str) -> list[Benchmark]:
+    """simulate_single, simulate_sequence and run_grn in every variant this tree supports (generated modules are written
+    to directory)"""
+    benchmarks: list[Benchmark] = []
+    for size in SIMULATION_SIZES:
+        multiplier: grn.grn = get_array_multiplier(size, **PARAMS)
+        num_inputs: int = len(multiplier.input_species_names)
+        inputs: list[int] = [INPUT_CONCENTRATION_MAX] * num_inputs
+        input_combinations: list[tuple[int,...]] = list(itertools.product([INPUT_CONCENTRATION_MIN, INPUT_CONCENTRATION_MAX], repeat=num_inputs))[:SEQUENCE_PHASES]
+        R0: np.ndarray = np.zeros(len(multiplier.species_names) - num_inputs)
+        for variant in SIMULATION_VARIANTS:
+            arguments: dict[str, Any] | None = get_simulation_arguments(multiplier, variant, directory)
+            if arguments is None:
+                continue
+            benchmarks.append(measure("simulate_single", size, lambda multiplier=multiplier, inputs=inputs, R0=R0, arguments=arguments: simulator.simulate_single(multiplier, inputs, t_end=T_SINGLE, plot_on=False, R0=R0, **arguments), variant))
+            benchmarks.append(measure("simulate_sequence", size, lambda multiplier=multiplier, input_combinations=input_combinations, arguments=arguments: simulator.simulate_sequence(multiplier, input_combinations, t_single=T_SINGLE, plot_on=False, **arguments), variant))
+    for size in RUN_GRN_SIZES:
+        multiplier = get_array_multiplier(size, **PARAMS)
+        for variant in RUN_GRN_VARIANTS:
+            if takes(run_grn, variant):
+                benchmarks.append(measure("run_grn", size, lambda multiplier=multiplier, variant=variant: run_grn(multiplier, **variant), variant, repeat=1))
+    return benchmarks
+
+def benchmark_grid_search(directory: str) -> list[Benchmark]:
+    """grid_search over GRID_SLICE, its rhs evaluations are summed from the result store (the pool's workers
+    integrate), or left out for trees without one. Peak memory is the one of this (the coordinating) process."""
+    defaults: dict[str, list] = {name: getattr(optimization, name) for name in GRID_SLICE}
+    results_file: str = os.path.join(directory, "grid_search.db")
+    store_arguments: dict[str, Any] = {"results_file": results_file} if results is not None and takes(optimization.grid_search, {"results_file": None}) else {}
+    benchmarks: list[Benchmark] = []
+    try:
+        for name, values in GRID_SLICE.items():
+            setattr(optimization, name, values)
+        for variant in GRID_SEARCH_VARIANTS:
+            if not takes(optimization.grid_search, variant):
+                continue
+            def grid_search(variant: dict[str, Any] = variant):
+                if os.path.exists(results_file):
+                    os.remove(results_file)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    optimization.grid_search(2, **variant, **store_arguments)
+            benchmark: Benchmark = measure("grid_search", 2, grid_search, variant, repeat=1, verbose=False)
+            for key in ("nfev", "njev", "nlu", "n_steps"):
+                benchmark[key] = None
+            if results is not None and store_arguments:
+                with results.ResultStore(results_file) as store:
+                    records = store.records(2)
+                for key in ("nfev", "njev", "nlu", "n_steps"):
+                    benchmark[key] = int(sum(float(record[key]) for record in records))
+            print_benchmark(benchmark)
+            benchmarks.append(benchmark)
+    finally:
+        for name, values in defaults.items():
+            setattr(optimization, name, values)
+    return benchmarks
+
+def run_benchmarks(filename: str):
+    """Run every benchmark and write the results (with the versions and machine they ran on) to filename as JSON"""
+    with tempfile.TemporaryDirectory() as directory:
+        sys.path.insert(0, directory)
+        try:
+            benchmarks: list[Benchmark] = [
+                *benchmark_construction(),
+                *benchmark_code_generation(directory),
+                *benchmark_simulation(directory),
+                *benchmark_grid_search(directory),
+            ]
+        finally:
+            sys.path.remove(directory)
+    report: dict[str, Any] = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "benchmarks": benchmarks,
+    }
+    with open(filename, "wt") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {filename}")
+
+def compare_benchmarks(baseline_filename: str, filename: str):
+    """Print wall time, rhs evaluations and peak memory of filename relative to baseline_filename, for the benchmarks
+    (name, size and variant) both ran"""
+    def get_key(benchmark: Benchmark) -> tuple[str, int | None, str]:
+        return benchmark["name"], benchmark["size"], benchmark.get("variant", "")
+    with open(baseline_filename, "rt") as file:
+        baseline: dict[tuple[str, int | None, str], Benchmark] = {get_key(b): b for b in json.load(file)["benchmarks"]}
+    with open(filename, "rt") as file:
+        benchmarks: list[Benchmark] = json.load(file)["benchmarks"]
+    def ratio(new: float | None, old: float | None) -> str:
+        return f"{new / old:8.2f}x" if new is not None and old else f"{'-':>9}"
+    print(f"{'benchmark':<26} {'size':<4} {'variant':<44} {'time':>9} {'nfev':>9} {'memory':>9}")
+    for benchmark in benchmarks:
+        old: Benchmark | None = baseline.get(get_key(benchmark))
+        if old is None:
+            continue
+        print(f"{benchmark['name']:<26} {benchmark['size']!s:<4} {get_key(benchmark)[2]:<44} {ratio(benchmark['wall_time'], old['wall_time'])} {ratio(benchmark['nfev'], old['nfev'])} {ratio(benchmark['peak_memory'], old['peak_memory'])}")
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("run", "compare") or (sys.argv[1] == "compare" and len(sys.argv) < 4):
+        print(f"Usage: python -m src.benchmarks run [results.json]")
+        print(f"       python -m src.benchmarks compare <baseline.json> <results.json>")
+        exit(1)
+    if sys.argv[1] == "run":
+        run_benchmarks(sys.argv[2] if len(sys.argv) > 2 else f"benchmarks-{datetime.date.today()}.json")
+    else:
+        compare_benchmarks(sys.argv[2], sys.argv[3])
+
+if __name__ == "__main__":
+    main()
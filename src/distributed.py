@@ -0,0 +1,158 @@
+from multiprocessing.managers import BaseManager
+from typing import Callable
+from src.optimization import N_WORKERS, PARAM_ALPHA_VALUES, PARAM_DELTA_VALUES, PARAM_GRID_SIZE, PARAM_KD_VALUES, PARAM_N_VALUES, CostModel, get_tasks, print_record
+from src.results import ParamKey, Record, ResultStore, get_param_key, get_results_filename
+import simulator
+import itertools
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+PORT: int = 50123
+HOST: str = "127.0.0.1"             # interface the coordinator listens on unless one is given
+AUTHKEY_VARIABLE: str = "GRN_SWEEP_AUTHKEY"
+CHUNK_SIZE: int = 64                # parameter points handed to a worker at once
+LEASE_TIMEOUT: float = 3600.0       # seconds after which an unfinished chunk is handed out again
+WAIT_INTERVAL: float = 5.0          # seconds a worker waits when all remaining chunks are leased
+CONNECT_TIMEOUT: float = 60.0       # seconds a worker keeps retrying to reach a coordinator that isn't up yet
+
+class CoordinatorManager(BaseManager):
+    pass
+
+class WorkerManager(BaseManager):
+    # registered in run_worker, proxies the coordinator's SweepQueue
+    get_queue: Callable[[], "SweepQueue"]
+
+def get_authkey(authkey: bytes | None = None) -> bytes:
+    """authkey, or the GRN_SWEEP_AUTHKEY environment variable
+
+    The managers exchange pickles, which can run arbitrary code, so there is no default key: every coordinator and
+    worker of a sweep has to be given the same secret.
+    """
+    if authkey is None and os.environ.get(AUTHKEY_VARIABLE):
+        authkey = os.environ[AUTHKEY_VARIABLE].encode()
+    if not authkey:
+        raise Exception(f"No authkey: set {AUTHKEY_VARIABLE} (the same secret on the coordinator and all workers) or pass authkey")
+    return authkey
+
+class SweepQueue:
+    """Work queue of a coordinator: chunks of parameter points are leased to workers and their records collected
+
+    A chunk that isn't returned within LEASE_TIMEOUT (e.g. its worker died) is leased again; records of a chunk that
+    was already returned are dropped, so every point is stored once.
+    """
+
+    def __init__(self, param_points: list[tuple[int|float,...]], chunk_size: int, min_accuracy: float | None):
+        self.chunks: dict[int, list[tuple[int|float,...]]] = {i: param_points[start:start+chunk_size] for i, start in enumerate(range(0, len(param_points), chunk_size))}
+        self.min_accuracy: float | None = min_accuracy
+        self.unleased: list[int] = list(self.chunks)
+        self.leases: dict[int, float] = {}
+        self.results: queue.Queue[list[Record]] = queue.Queue()
+        self.lock: threading.Lock = threading.Lock()
+
+    def get_chunk(self) -> tuple[int, list[tuple[int|float,...]], float | None] | None:
+        """(chunk id, parameter points, min_accuracy) of the next chunk, (-1, [], None) if all remaining chunks are
+        leased (ask again later) or None once every chunk is done"""
+        with self.lock:
+            if not self.unleased:
+                expired: list[int] = [i for i, leased in self.leases.items() if time.time() - leased > LEASE_TIMEOUT]
+                self.unleased.extend(expired)
+            if not self.unleased:
+                return None if not self.leases else (-1, [], None)
+            chunk_id: int = self.unleased.pop(0)
+            self.leases[chunk_id] = time.time()
+            return chunk_id, self.chunks[chunk_id], self.min_accuracy
+
+    def put_records(self, chunk_id: int, records: list[Record]):
+        with self.lock:
+            if chunk_id not in self.leases:
+                return
+            del self.leases[chunk_id]
+            if chunk_id in self.unleased:
+                self.unleased.remove(chunk_id)
+        self.results.put(records)
+
+    def done(self) -> bool:
+        with self.lock:
+            return not self.unleased and not self.leases
+
+def serve_grid_search(size: int, address: tuple[str, int] = (HOST, PORT), chunk_size: int = CHUNK_SIZE, results_file: str | None = None, min_accuracy: float | None = None, authkey: bytes | None = None):
+    """Coordinator of a grid_search over several hosts: serves the points that results_file doesn't hold yet to
+    run_worker processes over TCP and stores (and prints) their records as they come back
+
+    It only listens on the loopback interface unless address names another one (e.g. ("0.0.0.0", PORT) for every
+    interface); see get_authkey for authkey.
+    """
+    authkey = get_authkey(authkey)
+    store: ResultStore = ResultStore(results_file or get_results_filename(size))
+    completed: set[ParamKey] = store.completed(size)
+    param_grid: list[tuple[int|float,...]] = [
+        params for params in itertools.product([size], PARAM_KD_VALUES, PARAM_N_VALUES, PARAM_ALPHA_VALUES, PARAM_DELTA_VALUES)
+        if get_param_key(params[1:]) not in completed
+    ]
+    # most expensive chunks first as far as the store tells (see CostModel)
+    sweep_queue: SweepQueue = SweepQueue(CostModel(store.records(size)).order(param_grid), chunk_size, min_accuracy)
+    CoordinatorManager.register("get_queue", callable=lambda: sweep_queue, exposed=("get_chunk", "put_records"))
+    # The server runs in this process (not a manager process), so its callables share sweep_queue
+    server = CoordinatorManager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    index: int = PARAM_GRID_SIZE - len(param_grid)
+    with store:
+        while not sweep_queue.done() or not sweep_queue.results.empty():
+            try:
+                records: list[Record] = sweep_queue.results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            store.add(records)
+            for record in records:
+                index += 1
+                print_record(record, index)
+        # totals of the phase statistics of instrumented workers (see run_worker)
+        simulator.print_phase_stats(store.phase_stats(size))
+
+def run_worker(address: tuple[str, int], batch_size: int | None = None, processes: int = N_WORKERS, instrument: bool = False, authkey: bytes | None = None):
+    """Worker of serve_grid_search: evaluates chunks on a local pool until the coordinator has no chunks left or is
+    gone. With instrument the records carry their phase statistics (see get_tasks), the coordinator stores them."""
+    WorkerManager.register("get_queue")
+    manager: WorkerManager = WorkerManager(address=address, authkey=get_authkey(authkey))
+    started: float = time.time()
+    while True:
+        try:
+            manager.connect()
+            break
+        except ConnectionRefusedError:
+            if time.time() - started > CONNECT_TIMEOUT:
+                raise
+            time.sleep(1.0)
+    sweep_queue = manager.get_queue()
+    with multiprocessing.Pool(processes=processes) as pool:
+        try:
+            while (chunk := sweep_queue.get_chunk()) is not None:
+                chunk_id, param_points, min_accuracy = chunk
+                if chunk_id < 0:
+                    time.sleep(WAIT_INTERVAL)
+                    continue
+                records: list[Record] = [record for task in get_tasks(pool, param_points, batch_size, min_accuracy, instrument=instrument) for record in task]
+                sweep_queue.put_records(chunk_id, records)
+        except (ConnectionError, EOFError):
+            # the coordinator finished (or stopped) while this worker was between chunks
+            pass
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("coordinator", "worker"):
+        print(f"Usage: python -m src.distributed coordinator <size> [port] [host]")
+        print(f"       python -m src.distributed worker <host> [port]")
+        print(f"The coordinator listens on {HOST} unless host is given, {AUTHKEY_VARIABLE} has to be set for both")
+        exit(1)
+    port: int = int(sys.argv[3]) if len(sys.argv) > 3 else PORT
+    if sys.argv[1] == "coordinator":
+        serve_grid_search(int(sys.argv[2]), address=(sys.argv[4] if len(sys.argv) > 4 else HOST, port))
+    else:
+        run_worker((sys.argv[2], port))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from src.adders import get_full_adder, get_half_adder
 import grn
-from src.synthesis import synthesize
+from typing import Iterable
+from src.synthesis import circuit_template, synthesize
 from src.utils import INPUT_CONCENTRATION_MAX, INPUT_CONCENTRATION_MIN, InputList, OutputList, get_regulators_list_and_products, to_structured_output_string, run_grn
 
+@circuit_template
 def get_carry_save_multiplier_row(size: int, param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
     # Initialization
     row: grn.grn = grn.grn()
@@ -39,6 +41,7 @@ def get_carry_save_multiplier_row(size: int, param_kd: float, param_n: float, pa
     )
     return row
 
+@circuit_template
 def get_carry_save_multiplier(size: int, param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
     # Initialization
     multiplier: grn.grn = grn.grn()
@@ -111,6 +114,7 @@ def get_carry_save_multiplier(size: int, param_kd: float, param_n: float, param_
     )
     return multiplier
 
+@circuit_template
 def get_array_multiplier_row(size: int, param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
 
     # Initialization
@@ -149,6 +153,7 @@ def get_array_multiplier_row(size: int, param_kd: float, param_n: float, param_a
     )
     return row
 
+@circuit_template
 def get_array_multiplier(size: int, param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
 
     # Initialization
@@ -219,6 +224,7 @@ def get_array_multiplier(size: int, param_kd: float, param_n: float, param_alpha
     )
     return multiplier
 
+@circuit_template
 def get_two_bit_multiplier(param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
 
     # Initialization
@@ -312,20 +318,25 @@ def get_two_bit_multiplier(param_kd: float, param_n: float, param_alpha: float,
 
     return multiplier
 
+def get_multiplier_operation(simulation_iteration: tuple[InputList, OutputList], operand_1_inputs: list[str], operand_2_inputs: list[str], outputs: list[str]) -> tuple[int, int, int]:
+    """(operand_1, operand_2, result) read from the logic levels of one simulated input combination"""
+    threshold: float = (INPUT_CONCENTRATION_MIN + INPUT_CONCENTRATION_MAX) / 2.0
+    inputs_iteration: dict[str, float] = {input_name: value for input_name, value in simulation_iteration[0]}
+    outputs_iteration: dict[str, float] = {output_name: value for output_name, value in simulation_iteration[1]}
+    operand_1_value, operand_2_value, result_value = 0, 0, 0
+    for operand_1_input in operand_1_inputs:
+        operand_1_value = operand_1_value * 2 + (int(inputs_iteration[operand_1_input] > threshold))
+    for operand_2_input in operand_2_inputs:
+        operand_2_value = operand_2_value * 2 + (int(inputs_iteration[operand_2_input] > threshold))
+    for output in outputs:
+        result_value = result_value * 2 + (int(outputs_iteration[output] > threshold))
+    return operand_1_value, operand_2_value, result_value
+
 def to_structured_output_multiplier_specific(simulation_results: list[tuple[InputList, OutputList]], operand_1_inputs: list[str], operand_2_inputs: list[str], outputs: list[str]) -> tuple[list[str], float]:
     result: list[str] = []
     correct: int = 0
-    threshold: float = (INPUT_CONCENTRATION_MIN + INPUT_CONCENTRATION_MAX) / 2.0
     for simlation_iteration in simulation_results:
-        inputs_iteration: dict[str, float] = {input_name: value for input_name, value in simlation_iteration[0]}
-        outputs_iteration: dict[str, float] = {output_name: value for output_name, value in simlation_iteration[1]}
-        operand_1_value, operand_2_value, result_value = 0, 0, 0
-        for operand_1_input in operand_1_inputs:
-            operand_1_value = operand_1_value * 2 + (int(inputs_iteration[operand_1_input] > threshold))
-        for operand_2_input in operand_2_inputs:
-            operand_2_value = operand_2_value * 2 + (int(inputs_iteration[operand_2_input] > threshold))
-        for output in outputs:
-            result_value = result_value * 2 + (int(outputs_iteration[output] > threshold))
+        operand_1_value, operand_2_value, result_value = get_multiplier_operation(simlation_iteration, operand_1_inputs, operand_2_inputs, outputs)
         result.append(f"{operand_1_value} * {operand_2_value} = {result_value}")
         if result_value != operand_1_value * operand_2_value:
             result[-1] = result[-1] + f" != {operand_1_value * operand_2_value}"
@@ -333,6 +344,18 @@ def to_structured_output_multiplier_specific(simulation_results: list[tuple[Inpu
             correct += 1
     return result, (correct/len(simulation_results))
 
+def get_multiplier_accuracy_fail_fast(simulation_results: Iterable[tuple[InputList, OutputList]], num_results: int, min_accuracy: float, operand_1_inputs: list[str], operand_2_inputs: list[str], outputs: list[str]) -> float:
+    """Accuracy of to_structured_output_multiplier_specific that stops consuming (a generator of) simulation_results
+    as soon as min_accuracy can't be reached anymore, then it returns the best accuracy that was still possible"""
+    wrong: int = 0
+    for simulation_iteration in simulation_results:
+        operand_1_value, operand_2_value, result_value = get_multiplier_operation(simulation_iteration, operand_1_inputs, operand_2_inputs, outputs)
+        if result_value != operand_1_value * operand_2_value:
+            wrong += 1
+            if (num_results - wrong) / num_results < min_accuracy:
+                break
+    return (num_results - wrong) / num_results
+
 def run_and_print_multiplier(size: int, multiplier: grn.grn):
     results: list[tuple[InputList, OutputList]] = run_grn(multiplier)
     structured_output_string: list[str] = to_structured_output_string(
@@ -1,11 +1,16 @@
-from typing import cast
+from typing import Callable, cast
 import grn
-from src.multipliers import get_array_multiplier, to_structured_output_multiplier_specific
-from src.utils import InputList, OutputList, run_grn
+from src.multipliers import get_array_multiplier, get_multiplier_accuracy_fail_fast, to_structured_output_multiplier_specific
+from src.utils import InputList, OutputList, get_threshold_margin, iterate_grn, run_grn, run_grn_parameter_batch, run_grn_quasi_steady
+from src.results import PARAM_NAMES, STAT_NAMES, ParamKey, Record, ResultStore, get_param_key, get_results_filename
+import functools
 import itertools
+import numpy as np
 import multiprocessing
-from multiprocessing import Lock, Value
 import os
+import queue
+import time
+import simulator
 
 N_WORKERS: int = cast(int, os.cpu_count())
 
@@ -14,40 +19,364 @@ PARAM_N_VALUES: list[int] = list(range(1, 10+1))
 PARAM_ALPHA_VALUES: list[int] = list(range(1, 10+1))
 PARAM_DELTA_VALUES: list[float] = list(map(lambda x: x/10.0, range(10)))
 PARAM_GRID_SIZE: int = len(PARAM_KD_VALUES) * len(PARAM_N_VALUES) * len(PARAM_ALPHA_VALUES) * len(PARAM_DELTA_VALUES)
+# Coarse grid of adaptive_search, every n-th value of kd, n, alpha and delta. The working region is only one or two
+# delta values thick (alpha/delta has to exceed the logic threshold while delta > 0), so delta isn't coarsened
+ADAPTIVE_COARSE_STEPS: tuple[int, ...] = (3, 3, 3, 1)
+# Budget of a single parameter point (a batch task gets it once per point), beyond it the point gets the status
+# "timeout" instead of stalling its worker (see simulator.set_solver_budget). None lifts a limit.
+POINT_MAX_TIME: float | None = 300.0
+POINT_MAX_NFEV: int | None = None
+# Tasks submitted to the pool at a time, every finished task is replaced by the most expensive remaining one
+TASKS_IN_FLIGHT: int = 2 * N_WORKERS
 
-lock = Lock()
-index = Value("i", 0)
+def get_multiplier_accuracy(multiplier: grn.grn, size: int, min_accuracy: float | None = None) -> float:
+    """Fraction of correct products over all input combinations
 
-def get_multiplier_accuracy(multiplier: grn.grn, size: int) -> float:
+    With min_accuracy the input combinations are simulated and scored one by one and the evaluation stops as soon as
+    min_accuracy is out of reach (e.g. at the first wrong product for min_accuracy=1.0); the result is then the best
+    accuracy that was still possible, which is below min_accuracy.
+    """
+    if min_accuracy is not None:
+        return get_multiplier_accuracy_fail_fast(
+            simulation_results=iterate_grn(multiplier),
+            num_results=2**len(multiplier.input_species_names),
+            min_accuracy=min_accuracy,
+            operand_1_inputs=[f"M_X{i}" for i in reversed(range(size))],
+            operand_2_inputs=[f"M_Y{i}" for i in reversed(range(size))],
+            outputs=[f"M_Z{i}" for i in reversed(range(2*size))],
+        )
     results: list[tuple[InputList, OutputList]] = run_grn(multiplier)
-    _, accuracy = to_structured_output_multiplier_specific(
-        simulation_results=results,
-        operand_1_inputs=[f"M_X{i}" for i in reversed(range(size))],
-        operand_2_inputs=[f"M_Y{i}" for i in reversed(range(size))],
-        outputs=[f"M_Z{i}" for i in reversed(range(2*size))],
-    )
+    return get_results_accuracy(results, size)
+
+def get_results_accuracy(results: list[tuple[InputList, OutputList]], size: int) -> float:
+    with simulator.phase("postprocess"):
+        _, accuracy = to_structured_output_multiplier_specific(
+            simulation_results=results,
+            operand_1_inputs=[f"M_X{i}" for i in reversed(range(size))],
+            operand_2_inputs=[f"M_Y{i}" for i in reversed(range(size))],
+            outputs=[f"M_Z{i}" for i in reversed(range(2*size))],
+        )
     return accuracy
 
-def print_multiplier_accuracy(params: tuple[int|float,...]) -> float:
-    global index
+def prescreen_multiplier_accuracy(multiplier: grn.grn, size: int) -> tuple[float, float]:
+    """(accuracy, margin) predicted from the quasi-steady states (utils.run_grn_quasi_steady), margin being how far the
+    predicted outputs are from the logic threshold (utils.get_threshold_margin)"""
+    with simulator.phase("prescreen"):
+        results: list[tuple[InputList, OutputList]] = run_grn_quasi_steady(multiplier)
+        return get_results_accuracy(results, size), get_threshold_margin(results)
+
+def is_screened_out(accuracy: float, margin: float, prescreen_margin: float | None, min_accuracy: float | None) -> bool:
+    """Whether a prediction of prescreen_multiplier_accuracy fails clearly enough (margin >= prescreen_margin) not to
+    simulate the point"""
+    return prescreen_margin is not None and accuracy < (min_accuracy or 1.0) and margin >= prescreen_margin
+
+def get_multiplier_accuracy_batch(size: int, params: list[tuple[int|float,...]]) -> list[float]:
+    """get_multiplier_accuracy for many (param_kd, param_n, param_alpha, param_delta) points at once
+
+    The multiplier topology doesn't depend on the parameters, so it is built and compiled once and the
+    parameters are passed as array axes (CompiledModel.with_parameters).
+    """
+    # Placeholder parameters, every one of them is replaced by the batch
+    with simulator.phase("build"):
+        array_multiplier: grn.grn = get_array_multiplier(size=size, param_kd=1, param_n=1, param_alpha=1, param_delta=1)
+    param_kd, param_n, param_alpha, param_delta = (np.array(values, dtype=float) for values in zip(*params))
+    results_batch: list[list[tuple[InputList, OutputList]]] = run_grn_parameter_batch(array_multiplier, param_kd, param_n, param_alpha, param_delta)
+    return [get_results_accuracy(results, size) for results in results_batch]
+
+def evaluate_multiplier_accuracy(params: tuple[int|float,...], min_accuracy: float | None = None, max_time: float | None = None, max_nfev: int | None = None, prescreen_margin: float | None = None) -> list[Record]:
+    """Accuracy of the array multiplier at (size, param_kd, param_n, param_alpha, param_delta), as a result record
+
+    With min_accuracy (see get_multiplier_accuracy) points that stopped early have the status "bounded". A point
+    that exceeds max_time seconds or max_nfev rhs evaluations has the status "timeout" and no accuracy (NaN).
+    With prescreen_margin a point whose quasi-steady prediction fails with at least that margin (see is_screened_out)
+    isn't simulated, it has the status "screened" and the predicted accuracy.
+    """
     size, param_kd, param_n, param_alpha, param_delta = params
-    array_multiplier: grn.grn = get_array_multiplier(
-        size=int(size),
-        param_kd=param_kd,
-        param_n=param_n,
-        param_alpha=param_alpha,
-        param_delta=param_delta,
+    simulator.reset_solver_stats()
+    start: float = time.perf_counter()
+    simulator.set_solver_budget(max_nfev, max_time)
+    try:
+        with simulator.phase("build"):
+            array_multiplier: grn.grn = get_array_multiplier(
+                size=int(size),
+                param_kd=param_kd,
+                param_n=param_n,
+                param_alpha=param_alpha,
+                param_delta=param_delta,
+            )
+        if prescreen_margin is not None:
+            accuracy, margin = prescreen_multiplier_accuracy(array_multiplier, int(size))
+            if is_screened_out(accuracy, margin, prescreen_margin, min_accuracy):
+                return [{**get_record(params, accuracy, time.perf_counter() - start, simulator.SOLVER_STATS), "status": "screened"}]
+        accuracy = get_multiplier_accuracy(array_multiplier, int(size), min_accuracy)
+    except TimeoutError:
+        return [{**get_record(params, float("nan"), time.perf_counter() - start, simulator.SOLVER_STATS), "status": "timeout"}]
+    finally:
+        simulator.set_solver_budget()
+    runtime: float = time.perf_counter() - start
+    record: Record = get_record(params, accuracy, runtime, simulator.SOLVER_STATS)
+    if min_accuracy is not None and accuracy < min_accuracy:
+        record["status"] = "bounded"
+    return [record]
+
+def evaluate_multiplier_accuracy_batch(params_batch: list[tuple[int|float,...]], max_time: float | None = None, max_nfev: int | None = None, prescreen_margin: float | None = None) -> list[Record]:
+    """evaluate_multiplier_accuracy for a batch of points integrated together, runtime and solver statistics of the
+    batch are split evenly between its points
+
+    The budget is len(params_batch) times the budget of a point. A batch that exceeds it is evaluated again point by
+    point (evaluate_multiplier_accuracy with the budget of a point), so only the points that exceed their own budget
+    get the status "timeout".
+    With prescreen_margin the points are screened one by one first and only the others are integrated.
+    """
+    size: int = int(params_batch[0][0])
+    screened: list[Record] = []
+    if prescreen_margin is not None:
+        simulated: list[tuple[int|float,...]] = []
+        for params in params_batch:
+            start: float = time.perf_counter()
+            with simulator.phase("build"):
+                multiplier: grn.grn = get_array_multiplier(size, *params[1:])
+            accuracy, margin = prescreen_multiplier_accuracy(multiplier, size)
+            if is_screened_out(accuracy, margin, prescreen_margin, None):
+                screened.append({**get_record(params, accuracy, time.perf_counter() - start, dict.fromkeys(STAT_NAMES, 0)), "status": "screened"})
+            else:
+                simulated.append(params)
+        if not simulated:
+            return screened
+        params_batch = simulated
+    simulator.reset_solver_stats()
+    start = time.perf_counter()
+    simulator.set_solver_budget(
+        None if max_nfev is None else max_nfev * len(params_batch),
+        None if max_time is None else max_time * len(params_batch),
     )
-    accuracy: float = get_multiplier_accuracy(array_multiplier, int(size))
-    with lock:
-        print(f"[{index.value+1}/{PARAM_GRID_SIZE}]: {param_kd=:02d}, {param_n=:02d}, {param_alpha=:02d}, {param_delta=:.3f} -> {accuracy=:0.1f}")
-        index.value += 1
-    return accuracy
+    try:
+        accuracies: list[float] = get_multiplier_accuracy_batch(size, [params[1:] for params in params_batch])
+    except TimeoutError:
+        return screened + [record for params in params_batch for record in evaluate_multiplier_accuracy(params, max_time=max_time, max_nfev=max_nfev)]
+    finally:
+        simulator.set_solver_budget()
+    runtime: float = (time.perf_counter() - start) / len(params_batch)
+    stats: dict[str, float] = {key: value / len(params_batch) for key, value in simulator.SOLVER_STATS.items()}
+    return screened + [get_record(params, accuracy, runtime, stats) for params, accuracy in zip(params_batch, accuracies)]
+
+def evaluate_instrumented(evaluate, params) -> list[Record]:
+    """evaluate(params) (evaluate_multiplier_accuracy or evaluate_multiplier_accuracy_batch) under
+    simulator.instrument, its phase statistics are split evenly between its records as their "phases" (stored by
+    ResultStore.add)"""
+    with simulator.instrument() as phases:
+        records: list[Record] = evaluate(params)
+    for record in records:
+        record["phases"] = {name: {key: value / len(records) for key, value in values.items()} for name, values in phases.items()}
+    return records
+
+def get_record(params: tuple[int|float,...], accuracy: float, runtime: float, stats: dict) -> Record:
+    size, param_kd, param_n, param_alpha, param_delta = params
+    return {
+        "size": int(size), "param_kd": param_kd, "param_n": param_n, "param_alpha": param_alpha, "param_delta": param_delta,
+        "accuracy": accuracy, "runtime": runtime, "nfev": stats["nfev"], "njev": stats["njev"], "nlu": stats["nlu"],
+        "n_steps": stats["n_steps"], "status": "ok",
+    }
+
+def print_record(record: Record, index: int):
+    param_kd, param_n, param_alpha, param_delta, accuracy = (record[key] for key in (*PARAM_NAMES, "accuracy"))
+    print(f"[{index}/{PARAM_GRID_SIZE}]: param_kd={param_kd:02.0f}, param_n={param_n:02.0f}, param_alpha={param_alpha:02.0f}, param_delta={param_delta:.3f} -> accuracy={accuracy:0.1f}", flush=True)
+
+class CostModel:
+    """Online estimate of the runtime of parameter points from the records of the points evaluated so far
+
+    log(runtime) is modelled as additive over the parameters: the mean log runtime of all records plus, for every
+    parameter, the deviation of the mean log runtime at the point's value of it from that mean (values without
+    records add nothing). Timed out records count with their runtime up to the timeout.
+    The solver work (nfev) isn't used: runtime also covers building, compiling and the Jacobian factorizations, and
+    on a complete size 2 sweep the runtime-based estimate ranks the runtimes of unseen points better (Spearman 0.73)
+    than the same estimate of log(nfev) (0.60) or of their sum (0.69).
+    """
+
+    def __init__(self, records: list[Record] | None = None):
+        self.total: list[float] = [0.0, 0]
+        self.sums: dict[tuple[str, ParamKey], list[float]] = {}
+        self.update(records or [])
+
+    def update(self, records: list[Record]):
+        for record in records:
+            # inferred records (adaptive_search) weren't evaluated
+            if record["status"] == "inferred" or not record["runtime"]:
+                continue
+            cost: float = np.log(float(record["runtime"]))
+            self.total[0] += cost
+            self.total[1] += 1
+            for name in PARAM_NAMES:
+                value_sum: list[float] = self.sums.setdefault((name, get_param_key([record[name]])), [0.0, 0])
+                value_sum[0] += cost
+                value_sum[1] += 1
+
+    def estimate(self, params: tuple[int|float,...]) -> float:
+        """Estimated log(runtime) of (size, param_kd, param_n, param_alpha, param_delta)"""
+        if not self.total[1]:
+            return 0.0
+        mean: float = self.total[0] / self.total[1]
+        estimate: float = mean
+        for name, value in zip(PARAM_NAMES, params[1:]):
+            value_sum: list[float] | None = self.sums.get((name, get_param_key([value])))
+            if value_sum is not None:
+                estimate += value_sum[0] / value_sum[1] - mean
+        return estimate
+
+    def estimates(self, param_points: np.ndarray) -> np.ndarray:
+        """estimate of every row (size, param_kd, param_n, param_alpha, param_delta) of param_points at once"""
+        estimates: np.ndarray = np.zeros(len(param_points))
+        if not self.total[1]:
+            return estimates
+        mean: float = self.total[0] / self.total[1]
+        estimates += mean
+        for column, name in enumerate(PARAM_NAMES, 1):
+            values, inverse = np.unique(param_points[:, column], return_inverse=True)
+            value_sums: list[list[float] | None] = [self.sums.get((name, get_param_key([value]))) for value in values]
+            estimates += np.array([0.0 if value_sum is None else value_sum[0] / value_sum[1] - mean for value_sum in value_sums])[inverse]
+        return estimates
+
+    def order(self, param_points: list[tuple[int|float,...]]) -> list[tuple[int|float,...]]:
+        """param_points from the most to the least expensive, so the stiff points don't end up last"""
+        return [param_points[i] for i in np.argsort(-self.estimates(np.array(param_points, dtype=float)), kind="stable")]
+
+def get_evaluate(batch_size: int | None, min_accuracy: float | None = None, prescreen_margin: float | None = None, instrument: bool = False) -> Callable[..., list[Record]]:
+    """The task function of get_tasks and evaluate_points: evaluates a point, or a batch of points with batch_size"""
+    max_time, max_nfev = POINT_MAX_TIME, POINT_MAX_NFEV
+    evaluate: Callable[..., list[Record]]
+    if batch_size is None:
+        evaluate = functools.partial(evaluate_multiplier_accuracy, min_accuracy=min_accuracy, max_time=max_time, max_nfev=max_nfev, prescreen_margin=prescreen_margin)
+    else:
+        evaluate = functools.partial(evaluate_multiplier_accuracy_batch, max_time=max_time, max_nfev=max_nfev, prescreen_margin=prescreen_margin)
+    if instrument:
+        evaluate = functools.partial(evaluate_instrumented, evaluate)
+    return evaluate
+
+def get_tasks(pool, param_points: list[tuple[int|float,...]], batch_size: int | None, min_accuracy: float | None = None, prescreen_margin: float | None = None, instrument: bool = False):
+    """Evaluate param_points on pool, one point per task or (batch_size) batches of points per task. Iterates over the
+    records of every task as it finishes. min_accuracy only applies to single points (no batch_size), every point has
+    the budget POINT_MAX_TIME/POINT_MAX_NFEV and is pre-screened with prescreen_margin (see
+    evaluate_multiplier_accuracy). With instrument the records carry the phase statistics of their task (see
+    evaluate_instrumented)."""
+    tasks: list = param_points if batch_size is None else [param_points[i:i+batch_size] for i in range(0, len(param_points), batch_size)]
+    return pool.imap_unordered(get_evaluate(batch_size, min_accuracy, prescreen_margin, instrument), tasks)
+
+def evaluate_points(pool, store: ResultStore, param_points: list[tuple[int|float,...]], batch_size: int | None, index: int, min_accuracy: float | None = None, costs: CostModel | None = None, prescreen_margin: float | None = None, instrument: bool = False) -> tuple[list[Record], int]:
+    """Evaluate param_points on pool (see get_tasks), appending every finished task to store and printing it (index
+    is the number of points printed so far). Returns (records, index).
+
+    At most TASKS_IN_FLIGHT tasks are on the pool at a time, and whenever one finishes the most expensive remaining
+    points by the estimate of costs (which learns from every finished task) are submitted in its place, so a stiff
+    point only occupies its own worker. Ties (no records yet) are broken in a fixed random order so that the first
+    tasks sample the whole grid. Batches group points of similar cost.
+    """
+    costs = costs or CostModel()
+    points: list[tuple[int|float,...]] = [param_points[i] for i in np.random.default_rng(0).permutation(len(param_points))]
+    point_array: np.ndarray = np.array(points, dtype=float).reshape(len(points), -1)
+    pending: np.ndarray = np.ones(len(points), dtype=bool)
+    evaluate = get_evaluate(batch_size, min_accuracy, prescreen_margin, instrument)
+    # records of the finished tasks (or the exception of a failed one), put by the pool's result thread
+    finished: queue.Queue[list[Record] | BaseException] = queue.Queue()
+    in_flight: int = 0
+    all_records: list[Record] = []
+    while pending.any() or in_flight:
+        while pending.any() and in_flight < TASKS_IN_FLIGHT:
+            estimates: np.ndarray = np.where(pending, costs.estimates(point_array), -np.inf)
+            chosen: np.ndarray = np.argsort(-estimates, kind="stable")[:min(batch_size or 1, int(pending.sum()))]
+            pending[chosen] = False
+            task = points[chosen[0]] if batch_size is None else [points[i] for i in chosen]
+            pool.apply_async(evaluate, (task,), callback=finished.put, error_callback=finished.put)
+            in_flight += 1
+        result: list[Record] | BaseException = finished.get()
+        in_flight -= 1
+        if isinstance(result, BaseException):
+            raise result
+        store.add(result)
+        costs.update(result)
+        for record in result:
+            index += 1
+            print_record(record, index)
+        all_records.extend(result)
+    return all_records, index
+
+def grid_search(size: int, batch_size: int | None = None, results_file: str | None = None, min_accuracy: float | None = None, prescreen_margin: float | None = None, instrument: bool = False):
+    """Evaluate the whole parameter grid, one point per task or (batch_size) batches of points per task
+
+    Every finished task is appended to the result store results_file (default get_results_filename(size)) and
+    printed. Points that the store already holds are skipped, so an interrupted search resumes where it stopped.
+    min_accuracy stops evaluating a point once it can't reach min_accuracy anymore (see get_multiplier_accuracy).
+    Points are scheduled by their estimated cost (see evaluate_points), the runtimes in the store seed the estimate;
+    points over the budget POINT_MAX_TIME/POINT_MAX_NFEV are stored with the status "timeout".
+    With prescreen_margin only points whose quasi-steady prediction passes or is within prescreen_margin of the logic
+    threshold are simulated, the others are stored with the status "screened" (see prescreen_multiplier_accuracy).
+    With instrument the time every point spent in each phase (see simulator.instrument) is stored along with its
+    record and the totals of the store are printed at the end.
+    """
+    store: ResultStore = ResultStore(results_file or get_results_filename(size))
+    completed: set[ParamKey] = store.completed(size)
+    param_grid: list[tuple[int|float,...]] = [
+        params for params in itertools.product([size], PARAM_KD_VALUES, PARAM_N_VALUES, PARAM_ALPHA_VALUES, PARAM_DELTA_VALUES)
+        if get_param_key(params[1:]) not in completed
+    ]
+    with store, multiprocessing.Pool(processes=N_WORKERS) as pool:
+        evaluate_points(pool, store, param_grid, batch_size, PARAM_GRID_SIZE - len(param_grid), min_accuracy, CostModel(store.records(size)), prescreen_margin, instrument)
+        if instrument:
+            simulator.print_phase_stats(store.phase_stats(size))
+
+def adaptive_search(size: int, coarse_steps: tuple[int, ...] = ADAPTIVE_COARSE_STEPS, batch_size: int | None = None, results_file: str | None = None, min_accuracy: float | None = None):
+    """Coarse-to-fine alternative to grid_search that only refines the grid where the accuracy changes
+
+    The grid is first evaluated every coarse_steps values along each axis (kd, n, alpha, delta), which splits it into
+    boxes. A box whose corners all work (accuracy 1.0) or all fail is taken to do so everywhere; any other box is
+    halved along every axis and the corners of the halves are evaluated next, until no box has interior points left.
+    The points of uniform boxes are finally added to the store with status "inferred" and the lowest accuracy of the
+    box corners, so the store covers the whole grid like a grid_search store (and src.analysis plots it the same
+    way). Resumes from the store and takes min_accuracy like grid_search.
+    """
+    axes: list[list] = [PARAM_KD_VALUES, PARAM_N_VALUES, PARAM_ALPHA_VALUES, PARAM_DELTA_VALUES]
+    def get_params(point: tuple[int, ...]) -> tuple[int|float,...]:
+        return (size, *(values[i] for values, i in zip(axes, point)))
+    def get_corners(box: tuple[tuple[int, ...], tuple[int, ...]]) -> list[tuple[int, ...]]:
+        return list(itertools.product(*(sorted({lo, hi}) for lo, hi in zip(*box))))
+
+    store: ResultStore = ResultStore(results_file or get_results_filename(size))
+    known: dict[ParamKey, float] = store.accuracies(size)
+    # Boxes between consecutive coarse grid indices, as (lowest, highest) corner indices
+    coarse: list[list[int]] = [sorted(set(range(0, len(values), step)) | {len(values) - 1}) for values, step in zip(axes, coarse_steps)]
+    boxes: list = [tuple(zip(*bounds)) for bounds in itertools.product(*(list(zip(c[:-1], c[1:])) or [(0, 0)] for c in coarse))]
+    uniform: list = []
+    index: int = len(known)
+    costs: CostModel = CostModel(store.records(size))
+
+    with store, multiprocessing.Pool(processes=N_WORKERS) as pool:
+        while boxes:
+            corners: set[tuple[int, ...]] = {corner for box in boxes for corner in get_corners(box)}
+            param_points: list[tuple[int|float,...]] = [get_params(p) for p in sorted(corners) if get_param_key(get_params(p)[1:]) not in known]
+            records, index = evaluate_points(pool, store, param_points, batch_size, index, min_accuracy, costs)
+            known.update({get_param_key(record[name] for name in PARAM_NAMES): float(record["accuracy"]) for record in records})
+
+            mixed: list = []
+            for box in boxes:
+                accuracies: list[float] = [known[get_param_key(get_params(corner)[1:])] for corner in get_corners(box)]
+                if len({accuracy >= 1.0 for accuracy in accuracies}) == 1:
+                    uniform.append((box, min(accuracies)))
+                elif any(hi - lo > 1 for lo, hi in zip(*box)):
+                    mixed.append(box)
+            # Halve the mixed boxes along every axis that still has interior points
+            boxes = []
+            for lo, hi in mixed:
+                halves = [((l, (l + h) // 2), ((l + h) // 2, h)) if h - l > 1 else ((l, h),) for l, h in zip(lo, hi)]
+                boxes.extend(tuple(zip(*bounds)) for bounds in itertools.product(*halves))
 
-def grid_search(size: int):
-    param_grid: list[tuple[int|float,...]] = list(itertools.product([size], PARAM_KD_VALUES, PARAM_N_VALUES, PARAM_ALPHA_VALUES, PARAM_DELTA_VALUES))
-    with multiprocessing.Pool(processes=N_WORKERS) as pool:
-        results: list[float] = pool.map(print_multiplier_accuracy, param_grid)
+        inferred: list[Record] = []
+        for (lo, hi), accuracy in uniform:
+            for point in itertools.product(*(range(l, h + 1) for l, h in zip(lo, hi))):
+                params: tuple[int|float,...] = get_params(point)
+                if get_param_key(params[1:]) not in known:
+                    known[get_param_key(params[1:])] = accuracy
+                    inferred.append({**get_record(params, accuracy, 0.0, dict.fromkeys(STAT_NAMES, 0)), "status": "inferred"})
+        store.add(inferred)
+    print(f"{index} of {PARAM_GRID_SIZE} points evaluated, {len(inferred)} inferred")
 
 def main():
     grid_search(size=2)
@@ -1,4 +1,5 @@
 import ast
+import functools
 import json
 from typing import Any, TypeAlias, cast
 import re
@@ -7,10 +8,22 @@ SpeciesList: TypeAlias = list[dict[str, Any]]
 
 def parse_dnf_str(input: str, param_kd: float, param_n: float) -> list[SpeciesList]:
     """Convert string of disjunctive normal form to regulators"""
-    stmts: list[ast.stmt] = ast.parse(ast_string_cleaner(input)).body
+    return [
+        [{"name": name, "type": type, "Kd": param_kd, "n": param_n} for name, type in minterm]
+        for minterm in parse_dnf_str_cached(ast_string_cleaner(input))
+    ]
+
+@functools.lru_cache(maxsize=None)
+def parse_dnf_str_cached(input: str) -> tuple[tuple[tuple[str, int], ...], ...]:
+    """parse_dnf_str without parameters, as (name, type) pairs per minterm; circuits parse the same few expressions
+    over and over, so every expression is only parsed once"""
+    stmts: list[ast.stmt] = ast.parse(input).body
     if len(stmts) != 1:
         raise Exception("Expression must have exactly one statement")
-    return parse_dnf(cast(ast.Expr, stmts[0]), param_kd, param_n)
+    return tuple(
+        tuple((regulator["name"], regulator["type"]) for regulator in regulators)
+        for regulators in parse_dnf(cast(ast.Expr, stmts[0]), param_kd=0, param_n=0)
+    )
 
 def parse_dnf(tree: ast.Expr, param_kd: float, param_n: float) -> list[SpeciesList]:
     """Convert expression of disjunctive normal form to regulators"""
@@ -0,0 +1,139 @@
+import re
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import Literal, TypedDict, cast
+
+ParamName = Literal["param_kd", "param_n", "param_alpha", "param_delta"]
+StatName = Literal["nfev", "njev", "nlu", "n_steps"]
+
+PARAM_NAMES: list[ParamName] = ["param_kd", "param_n", "param_alpha", "param_delta"]
+STAT_NAMES: list[StatName] = ["nfev", "njev", "nlu", "n_steps"]
+COLUMNS: list[str] = ["size", *PARAM_NAMES, "accuracy", "runtime", *STAT_NAMES, "status"]
+# Phase statistics of instrumented records (simulator.instrument), one row per point and phase
+PHASE_VALUES: list[str] = ["calls", "time", *STAT_NAMES, "failed"]
+PHASE_COLUMNS: list[str] = ["size", *PARAM_NAMES, "phase", *PHASE_VALUES]
+# Parameters are compared after rounding (param_delta is a float)
+KEY_DECIMALS: int = 6
+# A point of a grid search stdout log (see optimization.print_record), accuracy can be nan (timed out points)
+LOG_PATTERN: re.Pattern = re.compile(
+    r"param_kd=([-+.\d]+), param_n=([-+.\d]+), param_alpha=([-+.\d]+), param_delta=([-+.\d]+) -> accuracy=([-+.\deinfa]+)"
+)
+
+class RecordColumns(TypedDict):
+    size: int
+    param_kd: float
+    param_n: float
+    param_alpha: float
+    param_delta: float
+    accuracy: float
+    runtime: float
+    # solver statistics, a batch's are split evenly between its points
+    nfev: float
+    njev: float
+    nlu: float
+    n_steps: float
+    status: str
+
+class Record(RecordColumns, total=False):
+    """An evaluated parameter point, a row of the results table (RecordColumns) and the statistics of an instrumented
+    one by phase (rows of the phases table)"""
+    phases: dict[str, dict[str, float]]
+
+ParamKey = tuple[float, ...]
+
+def get_results_filename(size: int) -> str:
+    return f"out.array-{size}.db"
+
+def get_param_key(params) -> ParamKey:
+    """(param_kd, param_n, param_alpha, param_delta) as a hashable key for completed points"""
+    return tuple(round(float(param), KEY_DECIMALS) for param in params)
+
+class ResultStore:
+    """Append-only SQLite store of grid search results, one row per evaluated parameter point
+
+    Rows are only ever inserted (each add is one transaction), so a sweep that is interrupted keeps every point it
+    finished; completed() returns those points so the sweep can resume without them. Only one process (the one
+    collecting the pool's results) should write to a store.
+    """
+
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.connection: sqlite3.Connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "size INTEGER, param_kd REAL, param_n REAL, param_alpha REAL, param_delta REAL, "
+            "accuracy REAL, runtime REAL, nfev INTEGER, njev INTEGER, nlu INTEGER, n_steps INTEGER, status TEXT)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS phases ("
+            "size INTEGER, param_kd REAL, param_n REAL, param_alpha REAL, param_delta REAL, "
+            "phase TEXT, calls REAL, time REAL, nfev REAL, njev REAL, nlu REAL, n_steps REAL, failed REAL)"
+        )
+        self.connection.commit()
+
+    def add(self, records: list[Record]):
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [tuple(record.get(column) for column in COLUMNS) for record in records],
+            )
+            self.connection.executemany(
+                f"INSERT INTO phases ({', '.join(PHASE_COLUMNS)}) VALUES ({', '.join('?' * len(PHASE_COLUMNS))})",
+                [
+                    (record["size"], *(record[name] for name in PARAM_NAMES), phase, *(values.get(column, 0) for column in PHASE_VALUES))
+                    for record in records for phase, values in record.get("phases", {}).items()
+                ],
+            )
+
+    def completed(self, size: int) -> set[ParamKey]:
+        return set(self.accuracies(size))
+
+    def accuracies(self, size: int) -> dict[ParamKey, float]:
+        rows = self.connection.execute(f"SELECT {', '.join(PARAM_NAMES)}, accuracy FROM results WHERE size = ?", (size,))
+        # timed out points have no accuracy (NULL)
+        return {get_param_key(row[:-1]): float("nan") if row[-1] is None else row[-1] for row in rows}
+
+    def records(self, size: int) -> list[Record]:
+        rows = self.connection.execute(f"SELECT {', '.join(COLUMNS)} FROM results WHERE size = ?", (size,))
+        return [cast(Record, dict(zip(COLUMNS, row))) for row in rows]
+
+    def phase_stats(self, size: int) -> dict[str, dict[str, float]]:
+        """Phase statistics of the instrumented records of size, summed per phase (as simulator.instrument collects
+        them)"""
+        rows = self.connection.execute(
+            f"SELECT phase, {', '.join(f'SUM({column})' for column in PHASE_VALUES)} FROM phases WHERE size = ? GROUP BY phase", (size,)
+        )
+        return {row[0]: dict(zip(PHASE_VALUES, row[1:])) for row in rows}
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM results", self.connection)
+
+    def phases_to_dataframe(self) -> pd.DataFrame:
+        return pd.read_sql_query(f"SELECT {', '.join(PHASE_COLUMNS)} FROM phases", self.connection)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+def is_result_store(filename: str) -> bool:
+    with open(filename, "rb") as file:
+        return file.read(16) == b"SQLite format 3\x00"
+
+def read_log(filename: str) -> pd.DataFrame:
+    """Points of a grid search stdout log ("[i/N]: param_kd=.., ... -> accuracy=.."), parsed in bulk; other lines
+    (e.g. the phase statistics of an instrumented search) are skipped"""
+    with open(filename, "rt") as file:
+        points: list[tuple[str, ...]] = LOG_PATTERN.findall(file.read())
+    return pd.DataFrame(np.array(points, dtype=float).reshape(-1, len(PARAM_NAMES) + 1), columns=[*PARAM_NAMES, "accuracy"])
+
+def import_log(filename: str, store: ResultStore, size: int):
+    """Add the points of a grid search stdout log to store"""
+    store.add(cast(list[Record], read_log(filename).assign(size=size, status="ok").to_dict("records")))
@@ -1,10 +1,30 @@
-from typing import TypeAlias
+from typing import Callable, NamedTuple, TypeAlias
+import functools
+import inspect
 import grn
 from src.parser import SpeciesList
 
 ConnectionType: TypeAlias = tuple[grn.grn, str, grn.grn, str]
 LabeledGRN: TypeAlias = tuple[grn.grn, str]
 
+class TemplateParam(float):
+    """Placeholder parameter value templates are built with. Its slots are found by identity, so a value of the circuit
+    that merely equals it isn't taken for the parameter."""
+
+# Parameters templates are built with
+TEMPLATE_PARAMS: dict[str, float] = {
+    name: TemplateParam(value) for name, value in {"param_kd": 1.0, "param_n": 2.0, "param_alpha": 3.0, "param_delta": 4.0}.items()
+}
+
+class TemplateSlots(NamedTuple):
+    """Slots of a template (see grn.replace_parameters) that hold a parameter, with the parameter's name"""
+    delta: dict[int, str]
+    alpha: dict[int, str]
+    Kd: dict[tuple[int, int], str]
+    n: dict[tuple[int, int], str]
+
+_template_cache: dict[tuple, tuple[grn.grn, TemplateSlots]] = {}
+
 def synthesize(
         named_grns: list[LabeledGRN],        # GRN, name
         connections: list[ConnectionType],   # source GRN, output name, destination GRN, input name
@@ -17,6 +37,7 @@ def synthesize(
 
     synthesized: grn.grn = grn.grn()
     grn_to_name: dict[grn.grn, str] = {grn: name for grn, name in named_grns}
+    input_set: set[tuple[grn.grn, str]] = set(inputs)
     regulators: SpeciesList
     products: SpeciesList
     grn_name: str
@@ -30,7 +51,7 @@ def synthesize(
     # Now add the other (non-input) species
     for grn_, grn_name in named_grns:
         for species_name in grn_.species_names:
-            if not (grn_, species_name) in inputs:
+            if not (grn_, species_name) in input_set:
                 synthesized.add_species(f"{grn_name}_{species_name}", param_delta)
     # Finally, add the genes
     for grn_, grn_name in named_grns:
@@ -52,3 +73,51 @@ def synthesize(
 
     return synthesized
 
+
+def template_param(value: float) -> str | None:
+    return next((name for name, param in TEMPLATE_PARAMS.items() if value is param), None)
+
+def find_slots(template: grn.grn) -> TemplateSlots:
+    """Slots of a circuit built with TEMPLATE_PARAMS that hold one of them"""
+    slots: TemplateSlots = TemplateSlots({}, {}, {}, {})
+    for i, value in enumerate(template.species_delta):
+        if (name := template_param(value)) is not None:
+            slots.delta[i] = name
+    for g, record in enumerate(template.gene_records):
+        if (name := template_param(record.alpha)) is not None:
+            slots.alpha[g] = name
+        for r, (Kd, n) in enumerate(zip(record.regulator_Kd, record.regulator_n)):
+            if (name := template_param(Kd)) is not None:
+                slots.Kd[g, r] = name
+            if (name := template_param(n)) is not None:
+                slots.n[g, r] = name
+    return slots
+
+def instantiate(template: grn.grn, slots: TemplateSlots, param_kd: float, param_n: float, param_alpha: float, param_delta: float) -> grn.grn:
+    """Copy of a circuit built with TEMPLATE_PARAMS, with param_kd, param_n, param_alpha and param_delta in their slots"""
+    params: dict[str, float] = {"param_kd": param_kd, "param_n": param_n, "param_alpha": param_alpha, "param_delta": param_delta}
+    return template.replace_parameters(**{
+        field: {slot: params[name] for slot, name in field_slots.items()} for field, field_slots in slots._asdict().items()
+    })
+
+def circuit_template(builder: Callable[..., grn.grn]) -> Callable[..., grn.grn]:
+    """Memoize a circuit builder with the parameters param_kd, param_n, param_alpha and param_delta
+
+    Circuits don't change their structure with the parameters, so builder runs (parsing, nested synthesis) once per
+    value of its other arguments (e.g. size) with TEMPLATE_PARAMS, and every call instantiates that template.
+    """
+    signature: inspect.Signature = inspect.signature(builder)
+
+    @functools.wraps(builder)
+    def build(*args, **kwargs) -> grn.grn:
+        arguments: dict = signature.bind(*args, **kwargs).arguments
+        params: dict = {name: arguments.pop(name) for name in TEMPLATE_PARAMS}
+        key: tuple = (builder.__module__, builder.__qualname__, *arguments.values())
+        if key not in _template_cache:
+            template: grn.grn = builder(**arguments, **TEMPLATE_PARAMS)
+            _template_cache[key] = template, find_slots(template)
+        return instantiate(*_template_cache[key], **params)
+    return build
+
+def clear_template_cache():
+    _template_cache.clear()
@@ -3,13 +3,18 @@ import ast
 import grn
 import numpy as np
 import numpy.typing as npt
-from typing import TypeAlias
+from typing import Iterator, TypeAlias
 import itertools
+import functools
 import simulator
 
 INPUT_CONCENTRATION_MIN: int = 0
 INPUT_CONCENTRATION_MAX: int = 100
 T_SINGLE: int = 1000
+STEADY_TOL: float | None = 1e-6     # end a phase early once max |dy/dt| < STEADY_TOL (None: always integrate T_SINGLE)
+BACKEND: str = "numpy"              # model backend of the sequential simulation, see backends.load_backend
+INPUT_ORDER: str = "product"        # order in which run_grn applies the input combinations, see get_input_order
+INPUT_ORDERS: tuple[str, ...] = ("product", "gray")
 PLOT_ON: bool = False
 
 InputType: TypeAlias = tuple[str, float]
@@ -43,42 +48,141 @@ def get_structured_input_output(grn: grn.grn, input_combinations: list[tuple[int
     t_samples: npt.NDArray = get_t_samples(num_input_combinations=len(input_combinations), t_single=t_single)
     if len(input_combinations) != t_samples.shape[0]:
         print(f"Warning: {len(input_combinations)=} != {t_samples.shape[0]=}")
+    return get_structured_samples(grn, Y[t_samples])
+
+def get_structured_samples(grn: grn.grn, Y_samples: npt.NDArray) -> list[tuple[InputList, OutputList]]:
+    """Same as get_structured_input_output, for states already sampled once per input combination"""
     # Dear Santa, please provide me with built-in frozenlist this year, it's much cleaner than lists of tuples
     # Put results into mapping [(input_name, input_value)] |-> [(output_name, output_value)]
     results: list[tuple[InputList, OutputList]] = []
-    for t_sample in t_samples:
+    for Y_sample in Y_samples:
         inputs: InputList = []
         outputs: OutputList = []
         for species_index, species_name in enumerate(grn.species_names):
-            if species_name in grn.input_species_names:
-                inputs.append((species_name, float(Y.T[species_index][t_sample])))
+            if grn.is_input_species(species_name):
+                inputs.append((species_name, float(Y_sample[species_index])))
             else:
-                outputs.append((species_name, float(Y.T[species_index][t_sample])))
+                outputs.append((species_name, float(Y_sample[species_index])))
         results.append((inputs, outputs))
     return results
 
 def get_t_samples(num_input_combinations: int, t_single: int) -> npt.NDArray:
     return np.arange(num_input_combinations) * t_single + (t_single-1)
 
+def get_phase_t_samples(num_input_combinations: int, t_single: int) -> npt.NDArray:
+    """get_t_samples as times within each phase (simulate_sequence stores t_single+1 samples per phase)"""
+    return get_t_samples(num_input_combinations, t_single) % (t_single+1)
+
 def get_regulators_list_and_products(expression: str | ast.Expr, outputs: list[str], param_kd: float, param_n: float) -> tuple[list[SpeciesList], SpeciesList]:
     """Convert DNF expression and outputs to pair (regulators_list, products)"""
     regulators_list: list[SpeciesList] = parse_dnf(expression, param_kd, param_n) if isinstance(expression, ast.Expr) else parse_dnf_str(expression, param_kd, param_n)
     products: SpeciesList = [{"name": output} for output in outputs]
     return regulators_list, products
 
-def run_grn(grn: grn.grn) -> list[tuple[InputList, OutputList]]:
+def get_input_order(num_inputs: int, order: str | None = None) -> list[int]:
+    """Indices into the itertools.product order of the input combinations, in the order they are simulated (order
+    defaults to INPUT_ORDER)
+
+    "product": itertools.product order, consecutive combinations can flip many inputs at once
+    "gray":    reflected binary Gray code, consecutive combinations differ in exactly one input (which is the minimum
+               total number of input transitions over all combinations)
+    """
+    order = order or INPUT_ORDER
+    if order == "product":
+        return list(range(2**num_inputs))
+    if order == "gray":
+        return [i ^ (i >> 1) for i in range(2**num_inputs)]
+    raise Exception(f"Invalid input order: expected one of {INPUT_ORDERS}, got {order}")
+
+def get_input_combinations(num_inputs: int, order: str | None = None) -> list[tuple[int,...]]:
+    """All combinations of low/high input concentrations, in the given simulation order (see get_input_order)"""
+    input_combinations: list[tuple[int,...]] = list(itertools.product([INPUT_CONCENTRATION_MIN, INPUT_CONCENTRATION_MAX], repeat=num_inputs))
+    return [input_combinations[i] for i in get_input_order(num_inputs, order)]
+
+def to_product_order(results: list, num_inputs: int, order: str | None = None) -> list:
+    """Reorder per-combination results of a simulation in the given order back to itertools.product order"""
+    reordered: list = [None] * len(results)
+    for result, i in zip(results, get_input_order(num_inputs, order)):
+        reordered[i] = result
+    return reordered
+
+def run_grn(grn: grn.grn, ensemble: bool = False) -> list[tuple[InputList, OutputList]]:
+    """Simulate all input combinations, one after another or (ensemble=True) all at once as one stacked system
+
+    The combinations are applied in INPUT_ORDER, the results are always in itertools.product order.
+    One after another, every combination starts from the final state of the previous one. With ensemble=True every
+    combination starts from zero instead (see simulator.simulate_ensemble), so the results only match the sequential
+    ones for circuits with a unique steady state per input combination (delta > 0); circuits that remember their
+    history (e.g. delta = 0, nothing degrades) can end up in other states and get another accuracy.
+    """
+    num_inputs: int = len(grn.input_species_names)
     # Prepare exhaustive list of input combinations
-    input_combinations: list[tuple[int,...]] = list(itertools.product([INPUT_CONCENTRATION_MIN, INPUT_CONCENTRATION_MAX], repeat=len(grn.input_species_names)))
+    input_combinations: list[tuple[int,...]] = get_input_combinations(num_inputs)
     # Run simulation
-    _, Y = simulator.simulate_sequence(
+    simulate = simulator.simulate_ensemble if ensemble else functools.partial(simulator.simulate_sequence, backend=BACKEND)
+    # Only record the states get_structured_input_output would sample (PLOT_ON needs the whole trajectory)
+    _, Y = simulate(
         grn,
         input_combinations,
         t_single=T_SINGLE,
         plot_on=PLOT_ON,
+        steady_tol=STEADY_TOL,
+        t_samples=None if PLOT_ON else list(get_phase_t_samples(len(input_combinations), T_SINGLE)),
     )
     if not isinstance(Y, np.ndarray):
         raise Exception(f"Error: Y is not a numpy array {type(Y)=}")
     # Get actually somewhat readable results
-    results: list[tuple[InputList, OutputList]] = get_structured_input_output(grn, input_combinations=input_combinations, Y=Y, t_single=T_SINGLE)
-    return results
+    with simulator.phase("postprocess"):
+        if PLOT_ON:
+            return to_product_order(get_structured_input_output(grn, input_combinations=input_combinations, Y=Y, t_single=T_SINGLE), num_inputs)
+        return to_product_order(get_structured_samples(grn, Y), num_inputs)
+
+def iterate_grn(grn: grn.grn) -> Iterator[tuple[InputList, OutputList]]:
+    """run_grn as a generator, yields the result of every input combination as soon as its phase is simulated
+
+    The results come in simulation order (INPUT_ORDER), each of them lists its input values.
+    """
+    input_combinations: list[tuple[int,...]] = get_input_combinations(len(grn.input_species_names))
+    phases = simulator.simulate_sequence_phases(
+        grn,
+        input_combinations,
+        t_single=T_SINGLE,
+        steady_tol=STEADY_TOL,
+        t_samples=list(get_phase_t_samples(len(input_combinations), T_SINGLE)),
+        backend=BACKEND,
+    )
+    for _, Y_phase, _ in phases:
+        with simulator.phase("postprocess"):
+            results: list[tuple[InputList, OutputList]] = get_structured_samples(grn, Y_phase)
+        yield from results
+
+def run_grn_quasi_steady(grn: grn.grn) -> list[tuple[InputList, OutputList]]:
+    """Prediction of run_grn from the quasi-steady states of an acyclic network (simulator.get_quasi_steady_states),
+    without integrating; in itertools.product order"""
+    input_combinations: list[tuple[int,...]] = get_input_combinations(len(grn.input_species_names), order="product")
+    return get_structured_samples(grn, simulator.get_quasi_steady_states(grn, input_combinations))
+
+def get_threshold_margin(results: list[tuple[InputList, OutputList]]) -> float:
+    """Smallest distance of an output from the logic threshold, relative to the threshold (0 if an output has no
+    steady state)"""
+    threshold: float = (INPUT_CONCENTRATION_MIN + INPUT_CONCENTRATION_MAX) / 2.0
+    distances: npt.NDArray = np.array([abs(value - threshold) for _, outputs in results for _, value in outputs]) / threshold
+    return float(np.min(np.nan_to_num(distances, nan=0.0), initial=np.inf))
 
+def run_grn_parameter_batch(grn: grn.grn, param_kd: npt.ArrayLike, param_n: npt.ArrayLike, param_alpha: npt.ArrayLike, param_delta: npt.ArrayLike) -> list[list[tuple[InputList, OutputList]]]:
+    """run_grn for a batch of parameter vectors: grn is compiled once and all vectors are integrated together"""
+    num_inputs: int = len(grn.input_species_names)
+    # Prepare exhaustive list of input combinations
+    input_combinations: list[tuple[int,...]] = get_input_combinations(num_inputs)
+    model = grn.compile_model().with_parameters(Kd=param_kd, n=param_n, alpha=param_alpha, delta=param_delta)
+    # Run simulation, sampled at the same times as get_structured_input_output samples run_grn's trajectory
+    Y: npt.NDArray = simulator.simulate_sequence_batch(
+        grn,
+        input_combinations,
+        model,
+        t_single=T_SINGLE,
+        t_samples=list(get_phase_t_samples(len(input_combinations), T_SINGLE)),
+        steady_tol=STEADY_TOL,
+    )
+    with simulator.phase("postprocess"):
+        return [to_product_order(get_structured_samples(grn, Y_batch), num_inputs) for Y_batch in Y]
@@ -0,0 +1,45 @@
+import importlib.util
+import numpy as np
+import pytest
+import grn
+import simulator
+from src.adders import get_full_adder
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_mixed_logic():
+    # 'or', 'and' and single-regulator genes with activators and repressors
+    network = grn.grn()
+    for name in ('A', 'B', 'C'):
+        network.add_input_species(name)
+    for name in ('X', 'Y', 'Z'):
+        network.add_species(name, 0.2)
+    regulators = [
+        {'name': 'A', 'type': 1, 'Kd': 4, 'n': 2},
+        {'name': 'B', 'type': 1, 'Kd': 6, 'n': 3},
+        {'name': 'C', 'type': -1, 'Kd': 5, 'n': 2},
+    ]
+    network.add_gene(10, regulators, [{'name': 'X'}], 'or')
+    network.add_gene(8, regulators, [{'name': 'Y'}], 'and')
+    network.add_gene(5, [{'name': 'X', 'type': 1, 'Kd': 3, 'n': 1}, {'name': 'Y', 'type': -1, 'Kd': 2, 'n': 2}], [{'name': 'Z'}], '')
+    network.add_gene(3, [{'name': 'Z', 'type': -1, 'Kd': 1, 'n': 4}], [{'name': 'X'}, {'name': 'Z'}], 'or')
+    return network
+
+@pytest.mark.parametrize("network", [get_mixed_logic(), get_full_adder(param_kd=5, param_n=2, param_alpha=10, param_delta=0.1)], ids=["mixed_logic", "full_adder"])
+def test_factored_model_equals_expanded(network, tmp_path):
+    network.generate_model(tmp_path / "model_expanded.py", factored=False)
+    network.generate_model(tmp_path / "model_factored.py", factored=True)
+    expanded = load_module(tmp_path / "model_expanded.py")
+    factored = load_module(tmp_path / "model_factored.py")
+    # the factored form is a different expression, not the same source
+    assert (tmp_path / "model_expanded.py").read_text() != (tmp_path / "model_factored.py").read_text()
+    rng = np.random.default_rng(0)
+    for state in rng.uniform(0, 20, size=(50, len(network.species_names))):
+        assert np.allclose(expanded.solve_model(0, state), factored.solve_model(0, state), rtol=1e-12, atol=1e-12)
+        # the Jacobian is generated the same way for both, so it is checked against differences of the rhs
+        assert np.allclose(factored.jac(0, state), simulator.numerical_jac(factored.solve_model, state), rtol=1e-4, atol=1e-5)
@@ -0,0 +1,27 @@
+import itertools
+import numpy as np
+import pytest
+import simulator
+from src.adders import get_two_bit_adder
+from src.multipliers import get_carry_save_multiplier, get_two_bit_multiplier
+from src.utils import INPUT_CONCENTRATION_MAX, INPUT_CONCENTRATION_MIN, STEADY_TOL, T_SINGLE
+
+PARAMS = {"param_kd": 5, "param_n": 2, "param_alpha": 10, "param_delta": 0.1}
+# largest deviation of a sampled concentration from LSODA (the concentrations go up to INPUT_CONCENTRATION_MAX)
+MAX_DEVIATION = 1e-3
+
+@pytest.mark.parametrize("circuit", [
+    get_two_bit_adder(**PARAMS),
+    get_two_bit_multiplier(**PARAMS),
+    get_carry_save_multiplier(3, **PARAMS),
+], ids=["two_bit_adder", "two_bit_multiplier", "carry_save_multiplier_3"])
+def test_rosenbrock_equals_lsoda(circuit):
+    # the end of every phase of the sequence of all input combinations, as run_grn samples it
+    input_combinations = list(itertools.product([INPUT_CONCENTRATION_MIN, INPUT_CONCENTRATION_MAX], repeat=len(circuit.input_species_names)))
+    ends = {
+        method: simulator.simulate_sequence(circuit, input_combinations, t_single=T_SINGLE, plot_on=False, method=method, steady_tol=STEADY_TOL, t_samples='end')[1]
+        for method in ("LSODA", "Rosenbrock")
+    }
+    threshold = (INPUT_CONCENTRATION_MIN + INPUT_CONCENTRATION_MAX) / 2
+    assert np.sum((ends["Rosenbrock"] > threshold) != (ends["LSODA"] > threshold)) == 0
+    assert np.abs(ends["Rosenbrock"] - ends["LSODA"]).max() < MAX_DEVIATION